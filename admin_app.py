@@ -1,43 +1,64 @@
 import os
 import sys
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-import requests
-from flask import Flask, render_template, jsonify, redirect, url_for, request
+from flask import Flask, Response, render_template, jsonify, redirect, url_for, request
 from datetime import datetime
 
+import admin_mode
+from order_history import read_history
+from order_journal import journal
+from order_store import orders, query_key
+from core.subscriber_snapshot import subscribers
+from metrics import metrics
+import boru_client
+import etag
+from boru_client import BoruClient
+
 # Flask uygulaması
 app = Flask(__name__)
 
 # Boru API'nin temel adresi
 BORU_API_BASE = "http://127.0.0.1:5055"
 
-# Mod dosyası (LOCAL / VPS toggle)
-MODE_FILE = "/opt/esentrader-boru-api/admin_mode.json"
+# Boru API istemcisi: boru_client.COHOSTED=True ise Boru API bu sürece yüklenir,
+# istekler HTTP'siz doğrudan handler'lara gider ve /api/* bu porttan da sunulur.
+boru = BoruClient(BORU_API_BASE)
+boru_client.mount(app, boru)
+
+# --- /metrics (Prometheus) ---
+metrics.instrument(app, "admin")
+metrics.gauge("journal_queue_depth", "Journal'a yazılmayı bekleyen kayıt", journal.depth)
+metrics.gauge(
+    "order_store_queue_depth", "orders.db'ye yazılmayı bekleyen kayıt",
+    lambda: orders.stats()["queue_depth"],
+)
+
+# Mod dosyası (LOCAL / VPS toggle) — admin_mode modülü ile ortak
+MODE_FILE = admin_mode.MODE_FILE
 
 
 # ================================================================
 # MOD OKUMA / YAZMA
 # ================================================================
 def load_mode() -> str:
-    """LOCAL / VPS mod bilgisini oku."""
-    if os.path.exists(MODE_FILE):
-        try:
-            with open(MODE_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            return data.get("mode", "LOCAL")
-        except Exception:
-            return "LOCAL"
-    return "LOCAL"
+    """LOCAL / VPS mod bilgisini oku (admin_mode cache'inden)."""
+    return admin_mode.get_admin_mode()
 
 
 def save_mode(mode: str) -> None:
-    """LOCAL / VPS mod bilgisini kaydet."""
+    """
+    LOCAL / VPS mod bilgisini kaydet.
+    admin_mode dinleyicileri (ör. IBKRClient) bu süreçte hemen,
+    Boru API sürecinde ise dosya mtime kontrolüyle haberdar olur.
+    """
     try:
-        with open(MODE_FILE, "w", encoding="utf-8") as f:
-            json.dump({"mode": mode}, f)
-    except Exception:
-        pass
+        admin_mode.set_admin_mode(mode)
+    except Exception as e:
+        print("save_mode error:", e)
 
 
 # SAĞLIK TESTİ
@@ -67,7 +88,7 @@ def admin_home():
 
     try:
         # Boru API status endpoint
-        r = requests.get(f"{BORU_API_BASE}/api/status", timeout=1)
+        r = _upstream("/api/status", timeout=1)
         api_status = r.json()
         api_ok = True
     except Exception as e:
@@ -100,7 +121,7 @@ def admin_change_mode(new_mode: str):
 @app.route("/admin/api/status")
 def admin_api_status():
     try:
-        resp = requests.get(f"{BORU_API_BASE}/api/status", timeout=3)
+        resp = _upstream("/api/status", timeout=3)
         data = resp.json()
         return jsonify(data), resp.status_code
     except Exception as e:
@@ -111,14 +132,25 @@ def admin_api_status():
 # ================================================================
 # YARDIMCI: BORU API'YE GÜVENLİ JSON PROXY
 # ================================================================
+def _upstream(path: str, method: str = "GET", payload: dict | None = None, timeout: int = 5):
+    """Boru API'ye tek istek (HTTP ya da cohosted); süre ve sonuç /metrics'e yazılır."""
+    labels = {"target": "boru_api", "path": path}
+    started = time.perf_counter()
+    try:
+        resp = boru.request(method, path, payload, timeout)
+    except Exception:
+        metrics.observe("upstream_request_duration_seconds", time.perf_counter() - started, labels)
+        metrics.inc("upstream_requests_total", dict(labels, outcome="error"))
+        raise
+    metrics.observe("upstream_request_duration_seconds", time.perf_counter() - started, labels)
+    metrics.inc("upstream_requests_total", dict(labels, outcome=str(resp.status_code)))
+    return resp
+
+
 def _proxy_json(path: str, method: str = "GET", payload: dict | None = None, timeout: int = 5):
     """Tek bir path'e istek at, JSON parse edemezsek raw text döndür."""
     try:
-        url = f"{BORU_API_BASE}{path}"
-        if method.upper() == "GET":
-            resp = requests.get(url, timeout=timeout)
-        else:
-            resp = requests.post(url, json=payload or {}, timeout=timeout)
+        resp = _upstream(path, method, payload, timeout)
 
         try:
             data = resp.json()
@@ -137,55 +169,94 @@ def _proxy_json(path: str, method: str = "GET", payload: dict | None = None, tim
 
 
 # ================================================================
-# YARDIMCI: BİRDEN FAZLA PATH DENE
+# YARDIMCI: BİRDEN FAZLA PATH DENE (route cache'li)
 # ================================================================
+ROUTE_TTL = 300.0          # bulunan path'in tekrar denenmeden kullanılacağı süre (sn)
+_route_cache = {}          # tuple(paths) → (path, expires_at)
+_route_lock = threading.Lock()
+_probe_pool = ThreadPoolExecutor(max_workers=6, thread_name_prefix="route-probe")
+
+
+def _try_path(path: str, method: str, payload: dict | None, timeout: int):
+    """
+    Tek path dener.
+    Dönen: (found, (data, status_code) | None, info)
+      found=True  → endpoint var (404 değil); data/status direkt döndürülür
+      found=False → 404 / bağlantı hatası, sıradaki path'e geçilir
+    """
+    try:
+        resp = _upstream(path, method, payload, timeout)
+    except Exception as e:
+        return False, None, {"error": str(e), "path": path}
+
+    if resp.status_code == 404:
+        return False, None, {"status_code": 404, "path": path, "raw": resp.text[:400]}
+
+    try:
+        data = resp.json()
+    except Exception:
+        info = {
+            "status_code": resp.status_code,
+            "path": path,
+            "raw": resp.text[:400],
+            "error": "JSON parse edilemedi",
+        }
+        # POST: endpoint isteği almış olabilir → başka path'e tekrar gönderme
+        if method.upper() != "GET":
+            return True, ({"ok": False, **info}, resp.status_code), info
+        return False, None, info
+    return True, (data, resp.status_code), {"path": path}
+
+
+def _remember_route(key: tuple, path: str | None) -> None:
+    with _route_lock:
+        if path is None:
+            _route_cache.pop(key, None)
+        else:
+            _route_cache[key] = (path, time.monotonic() + ROUTE_TTL)
+
+
 def _proxy_json_multi(paths: list[str], method: str = "GET", payload: dict | None = None, timeout: int = 5):
     """
-    Sırayla birden fazla endpoint dener.
-    İlk düzgün JSON dönen veya 404 dışındaki cevabı döner.
+    Birden fazla aday endpoint'ten çalışanını bulup ona proxy yapar.
+    - Çalışan path (aday listesi başına) ROUTE_TTL boyunca hatırlanır;
+      sonraki çağrılar direkt ona gider. Hata alırsa yeniden aranır.
+    - Soğuk başlangıçta GET adayları paralel denenir (liste sırası korunur).
+      POST (emir) asla paralel denenmez: aynı emir iki kez gidebilir.
     Hiçbiri çalışmazsa debug bilgisi ile hata döndürür.
     """
-    last_info = {}
-    for path in paths:
-        try:
-            url = f"{BORU_API_BASE}{path}"
-            if method.upper() == "GET":
-                resp = requests.get(url, timeout=timeout)
-            else:
-                resp = requests.post(url, json=payload or {}, timeout=timeout)
-
-            # 404 ise sonraki path'i dene
-            if resp.status_code == 404:
-                last_info = {
-                    "status_code": 404,
-                    "path": path,
-                    "raw": resp.text[:400],
-                }
-                continue
-
-            try:
-                data = resp.json()
-                # Başarılı JSON → direkt bunu döndür
-                return jsonify(data), resp.status_code
-            except Exception:
-                # JSON parse olmazsa sonraki path'e geç
-                last_info = {
-                    "status_code": resp.status_code,
-                    "path": path,
-                    "raw": resp.text[:400],
-                    "error": "JSON parse edilemedi",
-                }
-                continue
-
-        except Exception as e:
-            last_info = {"error": str(e), "path": path}
-            continue
+    key = tuple(paths)
+    with _route_lock:
+        cached = _route_cache.get(key)
+    if cached is not None and cached[1] > time.monotonic():
+        found, response, last_info = _try_path(cached[0], method, payload, timeout)
+        if found:
+            return jsonify(response[0]), response[1]
+        _remember_route(key, None)
+        # POST: 404 dışında bir hata aldıysak emir gitmiş olabilir, tekrar deneme
+        if method.upper() != "GET" and last_info.get("status_code") != 404:
+            return jsonify({"ok": False, "error": "Endpoint cevap vermedi", "last_info": last_info}), 502
+        paths = [p for p in paths if p != cached[0]]
+    else:
+        last_info = {}
+
+    if method.upper() == "GET" and len(paths) > 1:
+        futures = [_probe_pool.submit(_try_path, path, method, payload, timeout) for path in paths]
+        attempts = (f.result() for f in futures)
+    else:
+        attempts = (_try_path(path, method, payload, timeout) for path in paths)
+
+    for path, (found, response, info) in zip(paths, attempts):
+        if found:
+            _remember_route(key, path)
+            return jsonify(response[0]), response[1]
+        last_info = info
 
     # Hiçbir path düzgün çalışmadı
     return jsonify({
         "ok": False,
         "error": "Uygun endpoint bulunamadı",
-        "tried_paths": paths,
+        "tried_paths": list(key),
         "last_info": last_info,
     }), 502
 
@@ -222,6 +293,35 @@ def admin_api_positions():
     )
 
 
+# ================================================================
+# BORU API – CANLI OLAYLAR (SSE) PROXY (Trade Panel)
+# ================================================================
+@app.route("/admin/api/stream")
+def admin_api_stream():
+    """
+    /api/stream'i olduğu gibi aktarır. Tarayıcı sekmeleri yoklama yapmaz;
+    Boru API tarafında tek producer tüm sekmelere aynı olayları iter.
+    """
+    try:
+        status, content_type, chunks = boru.stream("/api/stream")
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 502
+    return Response(
+        chunks,
+        status=status,
+        content_type=content_type or "text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ================================================================
+# BORU API – GECİKME HİSTOGRAMLARI PROXY (Analytics sayfası)
+# ================================================================
+@app.route("/admin/api/latency")
+def admin_api_latency():
+    return _proxy_json("/api/latency", method="GET", timeout=5)
+
+
 # ================================================================
 # BORU API – MANUEL EMİR PROXY
 # ================================================================
@@ -242,17 +342,9 @@ def admin_api_order():
     # Panelden geldiğini not düş
     payload.setdefault("source", "admin_trade_panel")
 
-    # 2) Manuel emir defterine LOG yaz
-    try:
-        log_path = os.path.join(os.path.dirname(__file__), "manual_orders.log")
-        log_entry = {
-            "ts": datetime.utcnow().isoformat() + "Z",
-            **payload,
-        }
-        with open(log_path, "a", encoding="utf-8") as f:
-            f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
-    except Exception as e:
-        print("admin_api_order log error:", e)
+    # 2) Kayıt burada YAZILMAZ: /api/order emri journal'a ve orders.db'ye
+    #    kendisi yazar (order_id ile). Burada da yazmak her panel emrini
+    #    geçmişte / analizde iki kez saydırıyordu.
 
     # 3) Eski davranış: Boru API'ye proxy yap (hiç dokunmuyoruz)
     #    1) /api/order
@@ -317,41 +409,67 @@ def admin_tradehistory():
 @app.route("/admin/api/history")
 def admin_api_history():
     """
-    manual_orders.log dosyasından son emirleri okur
+    Son emirleri orders.db'den (yoksa manual_orders.log'dan) okur
     ve JSON olarak döner. (Sadece admin için)
-    """
-    log_path = os.path.join(os.path.dirname(__file__), "manual_orders.log")
-    history = []
 
+    Query parametreleri (hepsi opsiyonel):
+      limit, cursor, since, until, symbol, portfolio, source, side
+    En yeni kayıt önce gelir; sonraki sayfa için next_cursor kullanılır.
+    """
+    args = request.args
+    query = dict(
+        limit=min(args.get("limit", type=int) or 200, 1000),
+        cursor=args.get("cursor"),
+        since=args.get("since"),
+        until=args.get("until"),
+        symbol=args.get("symbol"),
+        portfolio=args.get("portfolio"),
+        source=args.get("source"),
+        side=args.get("side"),
+    )
+    # Önce SQLite (indeksli): tablo sürümü (son id) ve normalize sorgu
+    # (filtreler + cursor) aynıysa sorgu da serialize de yapılmaz → 304.
+    # DB kullanılamazsa ETag'siz, journal'ı sondan okuyarak cevap verilir.
     try:
-        with open(log_path, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    obj = json.loads(line)
-                    history.append(obj)
-                except Exception as e:
-                    print("admin_api_history parse error:", e, line[:200])
-    except FileNotFoundError:
-        history = []
+        tag = etag.make("history", orders.version(), query_key(query))
     except Exception as e:
-        print("admin_api_history read error:", e)
+        print("admin_api_history version error:", e)
+        tag = None
+    return etag.respond(tag, lambda: _history_payload(query))
 
+
+def _history_payload(query: dict):
     try:
-        history.sort(key=lambda x: x.get("ts", ""), reverse=True)
+        result = orders.query(**query)
+    except ValueError as e:
+        return {"ok": False, "error": f"invalid parameter: {e}"}, 400
     except Exception as e:
-        print("admin_api_history sort error:", e)
+        print("admin_api_history db error, journal fallback:", e)
+        try:
+            result = read_history(**query)
+        except Exception as e:
+            print("admin_api_history read error:", e)
+            result = {"history": [], "next_cursor": None}
 
-    history = history[:200]
+    return {
+        "ok": True,
+        "history": result["history"],
+        "next_cursor": result["next_cursor"],
+    }
 
-    return jsonify({"ok": True, "history": history})
 
 
 
 
 
+@app.route("/admin/api/analytics/orders")
+def admin_api_analytics_orders():
+    """Analiz sayfası için emir sayıları (portföy / taraf / kaynak / sembol)."""
+    try:
+        return jsonify({"ok": True, "summary": orders.summary(since=request.args.get("since"))})
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 500
+
 
 @app.route("/admin/ranks")
 def admin_ranks():
@@ -369,6 +487,37 @@ def admin_risk():
 def admin_subscribers():
     return render_template("admin_subscribers.html")
 
+@app.route("/admin/api/subscribers")
+def admin_api_subscribers():
+    """
+    Abone listesi (hafızadaki kolon snapshot'ından, DB'ye gitmez).
+    Query: active=1, offset, limit, id (tek abone)
+    """
+    snap = subscribers.get()
+    sub_id = request.args.get("id")
+    if sub_id:
+        try:
+            row = snap.get(int(sub_id))
+        except ValueError:
+            return jsonify({"ok": False, "error": "invalid id"}), 400
+        if row is None:
+            return jsonify({"ok": False, "error": "subscriber not found"}), 404
+        return jsonify({"ok": True, "subscriber": row, "version": snap.version})
+
+    try:
+        offset = max(0, int(request.args.get("offset", 0)))
+        limit = max(1, min(int(request.args.get("limit", 500)), 5000))
+    except ValueError:
+        return jsonify({"ok": False, "error": "invalid offset/limit"}), 400
+    return jsonify({
+        "ok": True,
+        "subscribers": snap.rows(
+            active_only=request.args.get("active") == "1", offset=offset, limit=limit
+        ),
+        "snapshot": subscribers.stats(),
+    })
+
+
 @app.route("/admin/settings")
 def admin_settings():
     return render_template("admin_settings.html")
@@ -407,9 +556,7 @@ def admin_manual_order():
     if qty is None and usd_amount is None:
         return jsonify({"ok": False, "error": "NO_SIZE"}), 400
 # ----------------------------------------------------------------------
-    # Log dosyasını proje klasörüne yazalım (en garantisi)
-    log_path = os.path.join(os.path.dirname(__file__), "manual_orders.log")
-
+    # Log: manual_orders.log (ortak journal, group commit)
     payload = {
         "ts": datetime.utcnow().isoformat() + "Z",
         "symbol": symbol,
@@ -425,8 +572,8 @@ def admin_manual_order():
     }
 
     try:
-        with open(log_path, "a", encoding="utf-8") as f:
-            f.write(json.dumps(payload) + "\n")
+        journal.append(payload)
+        orders.add(payload)
     except Exception as e:
         print("admin_manual_order log error:", e)
 
@@ -1,14 +1,23 @@
 import json
 import os
+import tempfile
+import threading
+import time
 
 MODE_FILE = os.path.join(os.path.dirname(__file__), "admin_mode.json")
 DEFAULT_MODE = "LOCAL"  # LOCAL veya VPS
 
-def get_admin_mode() -> str:
-    """
-    Admin panelindeki toggle butonunun seçtiği modu döndürür.
-    Dosya yoksa veya bozuksa DEFAULT_MODE döner.
-    """
+# Dosyanın mtime'ına en fazla bu aralıkla bakılır (saniye).
+# Arada gelen çağrılar hafızadaki modu döner, dosyaya hiç dokunmaz.
+CHECK_INTERVAL = 0.5
+
+_lock = threading.Lock()
+_cache = {"mode": None, "mtime": None, "checked": 0.0}
+_listeners = []
+
+
+def _read_mode_file() -> str:
+    """Mod dosyasını okur. Dosya yoksa veya bozuksa DEFAULT_MODE döner."""
     try:
         if not os.path.exists(MODE_FILE):
             return DEFAULT_MODE
@@ -23,19 +32,85 @@ def get_admin_mode() -> str:
         return DEFAULT_MODE
 
 
+def _file_mtime():
+    try:
+        return os.stat(MODE_FILE).st_mtime_ns
+    except OSError:
+        return None
+
+
+def add_mode_listener(fn) -> None:
+    """
+    Mod değişince çağrılacak fonksiyonu kaydeder: fn(old_mode, new_mode).
+    Değişiklik başka bir süreçte (ör. admin_app) yapılmış olsa da
+    mtime kontrolüyle yakalanır.
+    """
+    _listeners.append(fn)
+
+
+def _notify(old: str, new: str) -> None:
+    for fn in list(_listeners):
+        try:
+            fn(old, new)
+        except Exception as e:
+            print("admin_mode listener error:", e)
+
+
+def get_admin_mode() -> str:
+    """
+    Admin panelindeki toggle butonunun seçtiği modu döndürür.
+    Dosya yoksa veya bozuksa DEFAULT_MODE döner.
+
+    Sonuç hafızada tutulur; dosya sadece mtime'ı değiştiyse yeniden okunur.
+    """
+    now = time.monotonic()
+    mode = _cache["mode"]
+    if mode is not None and now - _cache["checked"] < CHECK_INTERVAL:
+        return mode
+
+    mtime = _file_mtime()
+    with _lock:
+        _cache["checked"] = now
+        old = _cache["mode"]
+        if old is not None and mtime == _cache["mtime"]:
+            return old
+        new = _read_mode_file()
+        _cache["mode"] = new
+        _cache["mtime"] = mtime
+
+    if old is not None and new != old:
+        _notify(old, new)
+    return new
+
+
 def set_admin_mode(mode: str) -> None:
     """
     Admin’den gelen yeni modu json dosyasına yazar.
+    Yarım yazılmış dosya okunmasın diye geçici dosya + rename kullanılır.
+    Geçici dosya her yazışta benzersizdir: admin paneli ve API süreci aynı
+    anda yazarsa birbirinin dosyasını ezmez / yarım haliyle taşımaz.
     """
     if mode not in ("LOCAL", "VPS"):
         mode = DEFAULT_MODE
 
+    get_admin_mode()  # eski mod hafızada olsun ki değişiklik bildirilsin
     data = {"mode": mode}
-    with open(MODE_FILE, "w", encoding="utf-8") as f:
+    with tempfile.NamedTemporaryFile(
+        "w", encoding="utf-8", dir=os.path.dirname(MODE_FILE),
+        prefix=".admin_mode.", suffix=".tmp", delete=False,
+    ) as f:
         json.dump(data, f)
+    try:
+        os.replace(f.name, MODE_FILE)
+    except OSError:
+        os.unlink(f.name)
+        raise
+
+    # Bu süreçteki dinleyiciler beklemeden haberdar olsun
+    _cache["checked"] = 0.0
+    get_admin_mode()
 
 
 if __name__ == "__main__":
     # Test için: python admin_mode.py
     print(get_admin_mode())
-
@@ -1,6 +1,16 @@
+import time
+from datetime import datetime
+
 from flask import Flask, jsonify, request
 from adapters.ibkr_adapter import IBKRBroker
 from core.master_trade import place_master_trade
+from core.copy_engine import fanout
+from order_store import orders
+from signal_dedup import SignalDedup, dedup_key
+from order_dispatch import CallTimeout, LaneFull, OrderDispatcher
+from order_journal import journal
+from latency import latency
+from signal_coalescer import COALESCE_WINDOW_MS, SignalCoalescer
 
 
 app = Flask(__name__)
@@ -18,6 +28,59 @@ ibkr = IBKRBroker(
 )
 app.config["MASTER_BROKER"] = ibkr
 
+# TradingView tekrarlarına karşı idempotency (signal_id / payload hash)
+signal_dedup = SignalDedup(store=orders)
+
+# Master hesap emirleri sıralı, sınırlı bir lane'den geçer
+dispatcher = OrderDispatcher(lanes=["master"])
+
+
+def _place_and_store(**kwargs):
+    master_event = place_master_trade(**kwargs)
+    orders.add(master_event)
+    return master_event
+
+
+def _dispatch_netted(bucket_id, netted, last):
+    """Netleştirme penceresi kapandı: net sinyali master lane'ine bırakır."""
+    if netted is None:
+        return
+    meta = dict(last["meta"])
+    meta["signal_id"] = f"netted:{bucket_id}"
+    try:
+        dispatcher.submit(
+            bucket_id,
+            {"symbol": netted["symbol"], "side": netted["side"], "usd_amount": netted["amount"]},
+            _place_and_store,
+            lane="master",
+            broker=last["broker"],
+            symbol=netted["symbol"],
+            side=netted["side"],
+            usd_amount=netted["amount"],
+            meta=meta,
+            max_price_age=last["max_price_age"],
+        )
+    except LaneFull as e:
+        print("netted signal rejected, lane full:", e.lane, bucket_id)
+
+
+def _late_result(key, future):
+    """Çağıran zaman aşımına uğradıktan sonra biten master emrini kaydeder."""
+    try:
+        master_event = future.result()
+    except Exception as e:
+        print("late master trade failed:", key, e)
+        signal_dedup.release(key)
+        return
+    signal_dedup.complete(key, master_event)
+    orders.add(master_event)
+
+
+# (symbol, portfolio) bazlı netleştirme penceresi (COALESCE_WINDOW_MS=0 → kapalı)
+coalescer = SignalCoalescer(
+    window_ms=COALESCE_WINDOW_MS, on_flush=_dispatch_netted, journal=journal
+)
+
 
 
 # -------------------------
@@ -27,11 +90,38 @@ app.config["MASTER_BROKER"] = ibkr
 def health():
     return jsonify({
         "status": "ok",
-        "service": "esentrader-boru-api"
+        "service": "esentrader-boru-api",
+        "fanout": fanout.stats()
     })
 
 
 
+# -------------------------
+#  GECİKME HİSTOGRAMLARI
+# -------------------------
+@app.route("/api/latency", methods=["GET"])
+def api_latency():
+    """Sinyal → master / follower ack / fill gecikmeleri (p50/p90/p99/max, ms)."""
+    return jsonify({"ok": True, **latency.snapshot()})
+
+
+
+# -------------------------
+#  EMİR DURUMU
+# -------------------------
+@app.route("/api/order/<order_id>", methods=["GET"])
+def api_order_status(order_id):
+    """
+    Lane'deki emrin durumu: ACCEPTED → SENDING → DONE | FAILED
+    (zaman aşımına uğrayan /api/signal çağrıları ve netleştirilen bucket'lar için).
+    """
+    state = dispatcher.get(order_id)
+    if state is None:
+        return jsonify({"ok": False, "error": "order not found", "order_id": order_id}), 404
+    return jsonify({"ok": True, **state})
+
+
+
 # -------------------------
 #  IBKR STATUS (DEMO)
 # -------------------------
@@ -82,6 +172,7 @@ def api_test():
 # ============================================================
 @app.route("/api/signal", methods=["POST"])
 def api_signal():
+    t_mono = time.monotonic()
     try:
         payload = request.get_json(force=True) or {}
 
@@ -123,16 +214,87 @@ def api_signal():
         meta = {
             "source": payload.get("source"),
             "strategy": payload.get("strategy"),
-            "signal_id": payload.get("signal_id")
+            "signal_id": payload.get("signal_id"),
+            "portfolio": payload.get("portfolio"),
+            "t_mono": t_mono
         }
-
-        master_event = place_master_trade(
-            broker=broker,
-            symbol=symbol,
-            side=side,
-            usd_amount=usd_amount,
-            meta=meta
-        )
+        # Sinyal bazında fiyat bayatlık sınırı (sn); yoksa broker varsayılanı
+        max_price_age = payload.get("max_price_age")
+        if max_price_age is not None:
+            max_price_age = float(max_price_age)
+
+        # Aynı sinyal daha önce işlendiyse broker'a gitmeden ilk sonucu dön
+        key = dedup_key(payload)
+        is_new, previous = signal_dedup.claim(key)
+        if not is_new:
+            if previous is None:
+                return jsonify({"ok": True, "duplicate": True, "pending": True}), 202
+            return jsonify({"ok": True, "duplicate": True, "event": previous})
+
+        # Netleştirme açıksa: pencereye bırak, emir pencere kapanınca gider
+        if coalescer.enabled and payload.get("coalesce", True):
+            bucket_id = coalescer.offer(
+                symbol, payload.get("portfolio"), side, usd_amount, "usd",
+                {"ref": payload.get("signal_id") or key, "signal_id": payload.get("signal_id"),
+                 "broker": broker, "meta": meta,
+                 "max_price_age": max_price_age},
+            )
+            coalesced_event = {
+                "ts": datetime.utcnow().isoformat() + "Z",
+                "event_type": "COALESCED",
+                "bucket_id": bucket_id,
+                "symbol": symbol,
+                "side": side,
+                "usd_amount": usd_amount,
+                "portfolio": payload.get("portfolio"),
+                "signal_id": payload.get("signal_id"),
+            }
+            # orders.db'ye de yazılır: restart sonrası find_by_signal_id tekrarı tanısın
+            orders.add(coalesced_event)
+            signal_dedup.complete(key, coalesced_event)
+            return jsonify({
+                "ok": True,
+                "coalesced": True,
+                "bucket_id": bucket_id,
+                "window_ms": coalescer.window_ms,
+                "event": coalesced_event,
+            }), 202
+
+        try:
+            master_event = dispatcher.call(
+                place_master_trade,
+                lane="master",
+                broker=broker,
+                symbol=symbol,
+                side=side,
+                usd_amount=usd_amount,
+                meta=meta,
+                max_price_age=max_price_age
+            )
+        except LaneFull as e:
+            signal_dedup.release(key)
+            resp = jsonify({"ok": False, "error": "ORDER_QUEUE_FULL", "retry_after": e.retry_after})
+            resp.headers["Retry-After"] = str(e.retry_after)
+            return resp, 429
+        except CallTimeout as e:
+            if not e.started:
+                # Emir lane'de hiç başlamadı (iptal edildi) → tekrar denenebilir
+                signal_dedup.release(key)
+                return jsonify({"ok": False, "error": "dispatch timeout", "order_id": e.order_id}), 504
+            # Emir broker'a gitmiş olabilir: anahtar "pending" kalır (retry ikinci
+            # emri açmaz), geç gelen sonuç dedup'a ve orders.db'ye yazılır
+            e.future.add_done_callback(lambda f: _late_result(key, f))
+            return jsonify({
+                "ok": True,
+                "pending": True,
+                "order_id": e.order_id,
+                "status_url": f"/api/order/{e.order_id}",
+            }), 202
+        except Exception:
+            signal_dedup.release(key)
+            raise
+        signal_dedup.complete(key, master_event)
+        orders.add(master_event)
 
         return jsonify({"ok": True, "event": master_event})
 
@@ -1,6 +1,10 @@
 # Copy Engine iskeleti
 # TradingView master emirlerinden follower hesaplara dağıtım burada yapılacak
 
+from core.allocation import allocate
+from core.subscriber_snapshot import subscribers
+
+
 class CopyEngine:
     def __init__(self):
         self.followers = []
@@ -9,8 +13,12 @@ class CopyEngine:
         self.followers.append(follower)
 
     def distribute(self, master_order):
-        # ileride oransal dağıtım burada yapılacak
+        # Oransal dağıtım: core.allocation (vektörel, abone snapshot'ından)
+        allocation = allocate(master_order, subscribers.get().followers())
+        summary = allocation.summary()
         return {
-            "distributed_to": len(self.followers),
+            "distributed_to": summary["orders"],
+            "allocation": summary,
+            "orders": allocation.orders(),
             "master_order": master_order
         }
@@ -5,17 +5,35 @@ EsenTrader Boru API (VPS tarafı)
 - /api/health
 - /api/ibkr/status
 - /api/ibkr/positions
+- /api/dashboard  : yukarıdakilerin paralel toplanmış özeti (web paneli)
+- /api/stream     : hesap / pozisyon / emir / mod değişiklikleri (SSE)
 
 IBKR ile direkt bağlantı KURMAZ.
 admin_mode + ibkr_client kullanarak uygun backend'e HTTP proxy yapar.
 """
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Response, render_template, jsonify, request
 
 from admin_mode import get_admin_mode
 from ibkr_client import IBKRClient
-
+from order_journal import JournalFull, journal
+from order_store import orders
+from order_dispatch import CallTimeout, LaneFull, OrderDispatcher
+from latency import latency
+from metrics import metrics
+import etag
+from event_stream import TooManyClients, events
+from signal_coalescer import COALESCE_WINDOW_MS, SignalCoalescer
+
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
-import os, json
+from uuid import uuid4
+import os, json, time
+
+# /api/dashboard: bölüm başına bekleme üst sınırı (saniye)
+DASHBOARD_TIMEOUT = 2.0
+
+# Journal kuyruğu doluyken istemciye önerilen bekleme (saniye)
+JOURNAL_RETRY_AFTER = 1
 
 # ----------------------------------------
 # Portfolio → IBKR Hesap mapping
@@ -33,6 +51,15 @@ portfolio_to_account = {
 # ----------------------------------------
 LIVE_MODE = False
 
+# ----------------------------------------
+# ASYNC emir kabulü (/api/order)
+#  True  -> LIVE emirlerde: doğrula + log + kuyruğa bırak, 202 + order_id dön;
+#           broker çağrısını worker havuzu yapar (/api/order/<order_id> ile izlenir)
+#  False -> eski davranış: broker cevabı beklenir
+#  Payload'da "async": false gönderilirse o emir için senkron çalışır.
+# ----------------------------------------
+ASYNC_ORDER_MODE = True
+
 
 def send_order_to_ibkr(symbol, side, qty, usd_amount,
                        portfolio, account_id, tp, sl, note, source):
@@ -62,18 +89,157 @@ def send_order_to_ibkr(symbol, side, qty, usd_amount,
 
 
 
+def _cache_meta(result):
+    """IBKRClient cache alanlarını cevap gövdesine taşır."""
+    return {
+        "cached": result.get("cached", False),
+        "age_ms": result.get("age_ms", 0),
+        "stale": result.get("stale", False),
+    }
+
+
+def _remote_payload(result):
+    """IBKRClient sonucunu /api/ibkr/status ve /positions cevap gövdesine çevirir."""
+    if result["ok"]:
+        return {
+            "mode": result["mode"],
+            "ok": True,
+            "url": result["url"],
+            "remote": result["data"],   # PC'den gelen ham JSON
+            **_cache_meta(result),
+        }, 200
+    return {
+        "mode": result["mode"],
+        "ok": False,
+        "url": result["url"],
+        "error": result["error"],
+        **_cache_meta(result),
+    }, 502
+
+
+def _cache_etag(name, result):
+    """Cache kaydının sürümünden ETag (hata / sürümsüz cevapta None)."""
+    if not result.get("ok") or result.get("version") is None:
+        return None
+    return etag.make(name, result["version"])
+
+
+def _lane_full_response(e: LaneFull):
+    """Hesabın emir kuyruğu dolu → 429 + Retry-After."""
+    resp = jsonify({
+        "ok": False,
+        "error": "ORDER_QUEUE_FULL",
+        "lane": e.lane,
+        "retry_after": e.retry_after,
+    })
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp, 429
+
+
+def _journal_full_response(e: JournalFull):
+    """
+    Journal kuyruğu dolu → 503 + Retry-After. Emir kayıtsız gönderilmez;
+    backpressure istemciye ulaşır.
+    """
+    print("journal full, order rejected:", e)
+    resp = jsonify({
+        "ok": False,
+        "error": "JOURNAL_FULL",
+        "retry_after": JOURNAL_RETRY_AFTER,
+    })
+    resp.headers["Retry-After"] = str(JOURNAL_RETRY_AFTER)
+    return resp, 503
+
+
+def _send_via_lane(**order_kwargs):
+    """send_order_to_ibkr'ı hesabın lane'inde çalıştırıp sonucunu bekler."""
+    try:
+        return dispatcher.call(
+            send_order_to_ibkr, lane=order_kwargs["account_id"], **order_kwargs
+        )
+    except CallTimeout as e:
+        # started=True ise emir hâlâ gidebilir: sonucu /api/order/<order_id>'den izlenir
+        return {"ok": False, "error": "dispatch timeout", "url": None, "mode": "error",
+                "order_id": e.order_id, "started": e.started}
+
+
+def _dispatch_netted(bucket_id, netted, last):
+    """
+    Netleştirme penceresi kapandı: net emri hesabın lane'ine bırakır.
+    Durum /api/order/<bucket_id> ile izlenir.
+    """
+    if netted is None:
+        dispatcher.tracker.update(
+            bucket_id,
+            state="CANCELLED_OUT",
+            finished_at=datetime.utcnow().isoformat() + "Z",
+        )
+        return
+
+    order_kwargs = dict(last["kwargs"])
+    order_kwargs["side"] = netted["side"]
+    if netted["unit"] == "qty":
+        order_kwargs["qty"] = netted["amount"]
+        order_kwargs["usd_amount"] = None
+    else:
+        order_kwargs["usd_amount"] = netted["amount"]
+        order_kwargs["qty"] = None
+
+    order_info = {k: order_kwargs[k] for k in
+                  ("symbol", "side", "qty", "usd_amount", "portfolio", "account_id")}
+    order_info["netted"] = True
+    try:
+        dispatcher.submit(
+            bucket_id, order_info, send_order_to_ibkr,
+            lane=order_kwargs["account_id"], **order_kwargs
+        )
+    except LaneFull as e:
+        print("netted order rejected, lane full:", e.lane, bucket_id)
+
+
 app = Flask(__name__)
 ibkr_client = IBKRClient()
+# /api/dashboard bölümlerini paralel toplamak için
+_dashboard_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="dashboard")
+# Her IBKR hesabı için ayrı, sıralı emir lane'i
+dispatcher = OrderDispatcher(lanes=portfolio_to_account.values())
+# (symbol, portfolio) bazlı netleştirme penceresi (COALESCE_WINDOW_MS=0 → kapalı)
+coalescer = SignalCoalescer(
+    window_ms=COALESCE_WINDOW_MS, on_flush=_dispatch_netted, journal=journal
+)
+
+# --- /metrics (Prometheus) ---
+metrics.instrument(app, "boru_api")
+metrics.gauge("journal_queue_depth", "Journal'a yazılmayı bekleyen kayıt", journal.depth)
+metrics.gauge(
+    "order_store_queue_depth", "orders.db'ye yazılmayı bekleyen kayıt",
+    lambda: orders.stats()["queue_depth"],
+)
+metrics.gauge(
+    "dispatch_lane_depth", "Hesap lane'inde bekleyen emir",
+    lambda: {(("lane", name),): m["depth"] for name, m in dispatcher.metrics().items()},
+)
+metrics.gauge(
+    "ibkr_connected", "IBKR bağlantısı (1 bağlı, 0 değil, -1 bilinmiyor)",
+    ibkr_client.connection_state,
+)
+
+# --- /api/stream (SSE): tek producer, tüm sekmeler aynı okumayı paylaşır ---
+events.add_source("mode", lambda: {"mode": get_admin_mode()})
+events.add_source("account", lambda: _account_payload()[0])
+events.add_source("positions", lambda: _remote_payload(ibkr_client.get_positions())[0])
+dispatcher.tracker.add_listener(lambda state: events.publish("order", state))
+metrics.gauge("stream_clients", "Bağlı /api/stream istemcisi", lambda: events.stats()["clients"])
 
 # --- Sağlık kontrolü endpoint'i ---
 @app.route("/api/status")
 def api_status():
-    return jsonify({
+    return {
         "ok": True,
         "service": "esentrader-boru-api",
         "version": "v1",
         "message": "boru API ayakta"
-    })
+    }
 
 
 @app.route("/")
@@ -106,14 +272,46 @@ def index():
     """
 
 
-@app.route("/api/health", methods=["GET"])
-def health():
-    """Temel sağlık kontrolü."""
-    return jsonify({
+def _health_payload():
+    return {
         "service": "esentrader-boru-api",
         "mode": get_admin_mode(),
         "status": "ok",
-    })
+        "ibkr_pool": ibkr_client.pool_stats(),
+        "dispatch": dispatcher.metrics(),
+        "coalescer": coalescer.stats(),
+        "stream": events.stats(),
+    }, 200
+
+
+@app.route("/api/health", methods=["GET"])
+def health():
+    """Temel sağlık kontrolü."""
+    data, status = _health_payload()
+    return data, status
+
+
+@app.route("/api/latency", methods=["GET"])
+def api_latency():
+    """Emir hattı gecikme histogramları (p50/p90/p99/max, ms)."""
+    return {"ok": True, **latency.snapshot()}
+
+
+@app.route("/api/stream", methods=["GET"])
+def api_stream():
+    """
+    Server-Sent Events: "mode", "account", "positions" (değişince, tam gövde),
+    "order" (emir durumu her değiştiğinde), "lagged" (tampon taştı → yeniden çek).
+    """
+    try:
+        client = events.subscribe()
+    except TooManyClients as e:
+        return {"ok": False, "error": str(e)}, 503
+    return Response(
+        events.stream(client),
+        content_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.route("/api/ibkr/status", methods=["GET"])
@@ -124,43 +322,51 @@ def api_ibkr_status():
     - VPS:   İleride VPS IBKR servisi
     """
     result = ibkr_client.get_status()
-
-    if result["ok"]:
-        return jsonify({
-            "mode": result["mode"],
-            "ok": True,
-            "url": result["url"],
-            "remote": result["data"],   # PC'den gelen ham JSON
-        })
-    else:
-        return jsonify({
-            "mode": result["mode"],
-            "ok": False,
-            "url": result["url"],
-            "error": result["error"],
-        }), 502
+    return etag.respond(_cache_etag("status", result), lambda: _remote_payload(result))
 
 # ============================================================
 # IBKR ACCOUNT — Trade Panel için basit endpointler
 # ============================================================
 
-@app.route("/api/ibkr/account", methods=["GET"])
-def api_ibkr_account():
+def _load_account():
     """
-    IBKR ana hesap özeti.
+    IBKR ana hesap özetini üretir (IBKRClient cache'i bunu çağırır).
     Şimdilik dummy; ileride gerçek IBKR client ile dolduracağız.
     """
-    data = {
+    return {
         "ok": True,
-        "account": {
+        "data": {
             "account": "DEMO",
             "cash": 0.0,
             "equity": 0.0,
             "currency": "USD",
             "buying_power": 0.0,
         },
+        "error": None,
+    }
+
+
+def _account_payload(result=None):
+    if result is None:
+        result = ibkr_client.cached("account", _load_account)
+    data = {
+        "ok": result["ok"],
+        "account": result["data"],
+        **_cache_meta(result),
     }
-    return jsonify(data)
+    if not result["ok"]:
+        data["error"] = result["error"]
+        return data, 502
+    return data, 200
+
+
+@app.route("/api/ibkr/account", methods=["GET"])
+def api_ibkr_account():
+    """
+    IBKR ana hesap özeti (TTL + stale-while-revalidate cache'li).
+    """
+    result = ibkr_client.cached("account", _load_account)
+    return etag.respond(_cache_etag("account", result), lambda: _account_payload(result))
 
 
 @app.route("/api/ibkr/account_summary", methods=["GET"])
@@ -179,21 +385,69 @@ def api_ibkr_positions():
     Uzak servisten gelen JSON'u 'remote' alanında döner.
     """
     result = ibkr_client.get_positions()
+    return etag.respond(_cache_etag("positions", result), lambda: _remote_payload(result))
+
 
-    if result["ok"]:
-        return jsonify({
-            "mode": result["mode"],
-            "ok": True,
-            "url": result["url"],
-            "remote": result["data"],
-        })
-    else:
-        return jsonify({
-            "mode": result["mode"],
-            "ok": False,
-            "url": result["url"],
-            "error": result["error"],
-        }), 502
+# ============================================================
+# DASHBOARD — web paneli için tek seferde özet
+# ============================================================
+
+def _dashboard_sections():
+    return {
+        "health": _health_payload,
+        "ibkr_status": lambda: _remote_payload(ibkr_client.get_status()),
+        "account": _account_payload,
+        "positions": lambda: _remote_payload(ibkr_client.get_positions()),
+    }
+
+
+def _timed_section(fn):
+    started = time.perf_counter()
+    try:
+        data, status = fn()
+        error = None if status < 400 else (data.get("error") or f"HTTP {status}")
+    except Exception as e:
+        data, error = None, str(e)
+    return {
+        "ok": error is None,
+        "ms": round((time.perf_counter() - started) * 1000, 1),
+        "data": data,
+        "error": error,
+    }
+
+
+@app.route("/api/dashboard", methods=["GET"])
+def api_dashboard():
+    """
+    health + ibkr/status + ibkr/account + ibkr/positions tek cevapta.
+    Bölümler paralel toplanır (çoğu IBKRClient cache'inden döner); cevap
+    süresi en yavaş bölüm kadardır, DASHBOARD_TIMEOUT'u geçen bölüm
+    "timeout" hatasıyla döner (arka planda bitip cache'i ısıtır).
+    Her bölüm: {"ok", "ms", "data" (ilgili endpoint'in gövdesi), "error"}
+    """
+    started = time.perf_counter()
+    futures = {
+        name: _dashboard_pool.submit(_timed_section, fn)
+        for name, fn in _dashboard_sections().items()
+    }
+    wait(futures.values(), timeout=DASHBOARD_TIMEOUT)
+
+    sections = {}
+    for name, future in futures.items():
+        if future.done():
+            sections[name] = future.result()
+        else:
+            sections[name] = {
+                "ok": False,
+                "ms": round(DASHBOARD_TIMEOUT * 1000, 1),
+                "data": None,
+                "error": f"timeout ({DASHBOARD_TIMEOUT}s)",
+            }
+    return {
+        "ok": all(section["ok"] for section in sections.values()),
+        "ms": round((time.perf_counter() - started) * 1000, 1),
+        "sections": sections,
+    }
 # ============================================================
 
 # ------------------------------------------------------
@@ -216,7 +470,7 @@ def api_order():
         payload = request.get_json(force=True, silent=True) or {}
     except Exception as e:
         print("api_order JSON error:", e)
-        return jsonify({"ok": False, "error": "INVALID_JSON"}), 400
+        return {"ok": False, "error": "INVALID_JSON"}, 400
 
     # Basit validasyon
     symbol = payload.get("symbol")
@@ -225,11 +479,11 @@ def api_order():
     usd_amount = payload.get("usd_amount")
 
     if not symbol or not side:
-        return jsonify({
+        return {
             "ok": False,
             "demo": True,
             "error": "symbol ve side zorunlu alanlardır.",
-        }), 400
+        }, 400
 
     # Portföy ve IBKR hesap ID'si
     portfolio = payload.get("portfolio") or "growth"
@@ -239,11 +493,10 @@ def api_order():
     sl = payload.get("sl_percent")
     note = payload.get("note")
     source = payload.get("source") or "tv_bot"
+    order_id = uuid4().hex
 
-    # --- LOG: manual_orders.log ---
+    # --- LOG: manual_orders.log (journal, group commit) ---
     try:
-        log_path = os.path.join(os.path.dirname(__file__), "manual_orders.log")
-
         log_entry = {
             "ts": datetime.utcnow().isoformat() + "Z",
             "symbol": symbol,
@@ -256,45 +509,117 @@ def api_order():
             "source": source,
             "portfolio": portfolio,
             "account_id": account_id,
+            "order_id": order_id,
         }
 
-        with open(log_path, "a", encoding="utf-8") as f:
-            f.write(json.dumps(log_entry) + "\n")
+        journal.append(log_entry)
+        orders.add(log_entry)
 
+    except JournalFull as e:
+        return _journal_full_response(e)
     except Exception as e:
         print("api_order log error:", e)
 
+    order_info = {
+        "symbol": symbol,
+        "side": side,
+        "qty": qty,
+        "usd_amount": usd_amount,
+        "portfolio": portfolio,
+        "account_id": account_id,
+    }
+    order_kwargs = dict(
+        symbol=symbol,
+        side=(side or "").upper(),
+        qty=qty,
+        usd_amount=usd_amount,
+        portfolio=portfolio,
+        account_id=account_id,
+        tp=tp,
+        sl=sl,
+        note=note,
+        source=source,
+    )
+
+    # --- LIVE + netleştirme penceresi: aynı sembol/portföy sinyallerini topla ---
+    if LIVE_MODE and account_id and coalescer.enabled and payload.get("coalesce", True):
+        unit, amount = ("qty", qty) if qty not in (None, "") else ("usd", usd_amount)
+        try:
+            amount = float(amount)
+        except (TypeError, ValueError):
+            amount = None
+        if amount and amount > 0:
+            bucket_id = coalescer.offer(
+                symbol, portfolio, order_kwargs["side"], amount, unit,
+                {"ref": order_id, "signal_id": payload.get("signal_id"), "kwargs": order_kwargs},
+            )
+            if dispatcher.get(bucket_id) is None:
+                dispatcher.tracker.add(bucket_id, {"symbol": symbol, "portfolio": portfolio})
+                dispatcher.tracker.update(bucket_id, state="COALESCING")
+            return {
+                "ok": True,
+                "demo": False,
+                "live": True,
+                "accepted": True,
+                "coalesced": True,
+                "message": "Emir netleştirme penceresine alındı.",
+                "order_id": order_id,
+                "bucket_id": bucket_id,
+                "window_ms": coalescer.window_ms,
+                "status_url": f"/api/order/{bucket_id}",
+                "order": order_info,
+            }, 202
+
+    # --- LIVE + ASYNC: kuyruğa bırak, broker'ı bekleme ---
+    if LIVE_MODE and account_id and payload.get("async", ASYNC_ORDER_MODE):
+        try:
+            state = dispatcher.submit(
+                order_id, order_info, send_order_to_ibkr, lane=account_id, **order_kwargs
+            )
+        except LaneFull as e:
+            return _lane_full_response(e)
+        return {
+            "ok": True,
+            "demo": False,
+            "live": True,
+            "accepted": True,
+            "message": "Emir kabul edildi, IBKR'a gönderiliyor.",
+            "order_id": order_id,
+            "state": state["state"],
+            "status_url": f"/api/order/{order_id}",
+            "order": order_info,
+        }, 202
+
     # --- LIVE: IBKR'a emir gönder (opsiyonel) ---
     ibkr_result = None
     if LIVE_MODE and account_id:
-        ibkr_result = send_order_to_ibkr(
-            symbol=symbol,
-            side=(side or "").upper(),
-            qty=qty,
-            usd_amount=usd_amount,
-            portfolio=portfolio,
-            account_id=account_id,
-            tp=tp,
-            sl=sl,
-            note=note,
-            source=source,
-        )
+        try:
+            ibkr_result = _send_via_lane(**order_kwargs)
+        except LaneFull as e:
+            return _lane_full_response(e)
 
-    return jsonify({
+    return {
         "ok": True,
         "demo": not LIVE_MODE,
         "live": LIVE_MODE,
         "message": "Emir kaydedildi. IBKR'a gönderme durumu: LIVE_MODE=%s" % LIVE_MODE,
-        "order": {
-            "symbol": symbol,
-            "side": side,
-            "qty": qty,
-            "usd_amount": usd_amount,
-            "portfolio": portfolio,
-            "account_id": account_id,
-        },
+        "order_id": order_id,
+        "order": order_info,
         "ibkr_result": ibkr_result,
-    }), 200
+    }, 200
+
+
+@app.route("/api/order/<order_id>", methods=["GET"])
+def api_order_status(order_id):
+    """
+    ASYNC kabul edilen emrin durumu:
+    ACCEPTED → SENDING → DONE | FAILED
+    Netleştirilen emirlerde (bucket_id): COALESCING → ACCEPTED → ... | CANCELLED_OUT
+    """
+    state = dispatcher.get(order_id)
+    if state is None:
+        return {"ok": False, "error": "order not found", "order_id": order_id}, 404
+    return {"ok": True, **state}
 
 
 
@@ -322,11 +647,11 @@ def api_ibkr_place_order():
     order_type = payload.get("order_type", "MKT")
 
     if not symbol or not side:
-        return jsonify({
+        return {
             "ok": False,
             "demo": True,
             "error": "symbol ve side zorunlu alanlardır.",
-        }), 400
+        }, 400
 
     portfolio = payload.get("portfolio") or "growth"
     account_id = portfolio_to_account.get(portfolio)
@@ -337,8 +662,6 @@ def api_ibkr_place_order():
 
     # --- LOG ---
     try:
-        log_path = os.path.join(os.path.dirname(__file__), "manual_orders.log")
-
         log_entry = {
             "ts": datetime.utcnow().isoformat() + "Z",
             "symbol": symbol,
@@ -353,29 +676,34 @@ def api_ibkr_place_order():
             "account_id": account_id,
         }
 
-        with open(log_path, "a", encoding="utf-8") as f:
-            f.write(json.dumps(log_entry) + "\n")
+        journal.append(log_entry)
+        orders.add(log_entry)
 
+    except JournalFull as e:
+        return _journal_full_response(e)
     except Exception as e:
         print("api_ibkr_place_order log error:", e)
 
     # --- LIVE: IBKR'a emir gönder (opsiyonel) ---
     ibkr_result = None
     if LIVE_MODE and account_id:
-        ibkr_result = send_order_to_ibkr(
-            symbol=symbol,
-            side=(side or "").upper(),
-            qty=qty,
-            usd_amount=usd_amount,
-            portfolio=portfolio,
-            account_id=account_id,
-            tp=tp,
-            sl=sl,
-            note=note,
-            source=source,
-        )
-
-    return jsonify({
+        try:
+            ibkr_result = _send_via_lane(
+                symbol=symbol,
+                side=(side or "").upper(),
+                qty=qty,
+                usd_amount=usd_amount,
+                portfolio=portfolio,
+                account_id=account_id,
+                tp=tp,
+                sl=sl,
+                note=note,
+                source=source,
+            )
+        except LaneFull as e:
+            return _lane_full_response(e)
+
+    return {
         "ok": True,
         "demo": not LIVE_MODE,
         "live": LIVE_MODE,
@@ -390,7 +718,7 @@ def api_ibkr_place_order():
             "account_id": account_id,
         },
         "ibkr_result": ibkr_result,
-    }), 200
+    }, 200
 
 
 
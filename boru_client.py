@@ -0,0 +1,201 @@
+"""
+boru_client.py
+Admin paneli (admin_app.py) ve web paneli (web/app.py) için Boru API istemcisi.
+
+İki çalışma şekli:
+- COHOSTED = False (varsayılan): Boru API ayrı süreçte (port 5055) çalışır,
+  istekler keep-alive'lı requests.Session ile HTTP üzerinden gider.
+- COHOSTED = True: Boru API (kök app.py) aynı sürece yüklenir. İstekler
+  soket / loopback HTTP / ek thread olmadan, çağıranın thread'inde doğrudan
+  view fonksiyonuna gider (before/after_request hook'ları dahil). Handler
+  dict döndürüyorsa o dict JSON'a çevrilmeden çağırana verilir; serialize /
+  parse sadece HTTP modda (ve Response döndüren handler'larda) yapılır.
+  Ayrıca ApiDispatcher ile frontend'in portunda /api/* Boru API'ye yönlenir.
+"""
+import importlib.util
+import json
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from etag import LOCAL_ENVIRON_KEY
+
+COHOSTED = False
+API_APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+POOL_SIZE = 10
+STREAM_READ_TIMEOUT = 60     # SSE: upstream heartbeat'inden (15 sn) uzun olmalı
+
+_api_app = None
+_api_lock = threading.Lock()
+
+
+def load_api_app():
+    """
+    Kök app.py'deki Flask app'ini (bir kez) yükler.
+    web/ altında "app" adı başka modüle ait olduğu için dosya yolundan yüklenir.
+    """
+    global _api_app
+    if _api_app is None:
+        with _api_lock:
+            if _api_app is None:
+                spec = importlib.util.spec_from_file_location("boru_api_app", API_APP_PATH)
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+                _api_app = module.app
+    return _api_app
+
+
+def _closing(chunks, close):
+    """chunks bitince ya da istemci kopunca (GeneratorExit) upstream'i kapatır."""
+    try:
+        yield from chunks
+    finally:
+        close()
+
+
+class LocalResponse:
+    """
+    requests.Response'un kullandığımız kısmı (status_code, json(), text).
+    data: handler'ın döndürdüğü dict (encode edilmedi); yoksa flask_response.
+    data kopyalanmaz (içinde ReadCache verisi olabilir) — salt okunur kullanın.
+    """
+
+    def __init__(self, status_code: int, headers=None, data=None, flask_response=None):
+        self.status_code = status_code
+        self.headers = headers if headers is not None else {}
+        self._data = data
+        self._resp = flask_response
+
+    def json(self):
+        if self._resp is None:
+            return self._data
+        data = self._resp.get_json(silent=True)
+        if data is None:
+            raise ValueError("JSON parse edilemedi")
+        return data
+
+    @property
+    def text(self) -> str:
+        if self._resp is None:
+            return json.dumps(self._data, default=str)
+        return self._resp.get_data(as_text=True)
+
+
+def _unpack(rv):
+    """Flask view dönüşü → (body, status, headers)."""
+    status, headers = 200, None
+    if isinstance(rv, tuple):
+        if len(rv) == 3:
+            rv, status, headers = rv
+        elif len(rv) == 2:
+            if isinstance(rv[1], (int, str)):
+                rv, status = rv
+            else:
+                rv, headers = rv
+    return rv, int(str(status).split()[0]), headers
+
+
+class BoruClient:
+    def __init__(self, base_url: str, cohosted: bool | None = None):
+        self.base_url = base_url
+        self.cohosted = COHOSTED if cohosted is None else cohosted
+        self.api_app = load_api_app() if self.cohosted else None
+        self.session = None
+        if not self.cohosted:
+            self.session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=0)
+            self.session.mount("http://", adapter)
+
+    def request(self, method: str, path: str, payload: dict | None = None, timeout=5):
+        """
+        path: "/api/..." — HTTP modda base_url'e eklenir.
+        Cohosted modda timeout uygulanmaz (çağrı senkron ve süreç içi).
+        """
+        method = method.upper()
+        if self.cohosted:
+            return self._local(method, path, payload)
+        url = f"{self.base_url}{path}"
+        if method == "GET":
+            return self.session.get(url, timeout=timeout)
+        return self.session.post(url, json=payload or {}, timeout=timeout)
+
+    def _local(self, method: str, path: str, payload: dict | None):
+        app = self.api_app
+        kwargs = {"method": method, "environ_overrides": {LOCAL_ENVIRON_KEY: True}}
+        if method != "GET":
+            kwargs["json"] = payload or {}
+        with app.test_request_context(path, **kwargs):
+            try:
+                rv = app.preprocess_request()
+                if rv is None:
+                    rv = app.dispatch_request()
+                body, status, headers = _unpack(rv)
+                if isinstance(body, (dict, list)):
+                    # after_request hook'ları (metrics) sadece status'e bakar:
+                    # gövdesiz cevapla çalıştırılır, dict encode edilmez
+                    response = app.finalize_request(app.response_class(status=status, headers=headers))
+                    return LocalResponse(response.status_code, response.headers, data=body)
+                response = app.finalize_request(rv)
+            except Exception as e:
+                # wsgi_app ile aynı: HTTPException (404 ...) kendi cevabı,
+                # yakalanmamış hata → 500 cevabı
+                try:
+                    response = app.finalize_request(app.handle_user_exception(e))
+                except Exception as e:
+                    response = app.handle_exception(e)
+        return LocalResponse(response.status_code, response.headers, flask_response=response)
+
+    def stream(self, path: str, connect_timeout=3):
+        """
+        Uzun süren GET (SSE). (status_code, content_type, chunk iterator) döner.
+        Cohosted modda Boru API generator'ı doğrudan çağıranın thread'inde akar.
+        """
+        if self.cohosted:
+            with self.api_app.test_request_context(path):
+                try:
+                    response = self.api_app.full_dispatch_request()
+                except Exception as e:
+                    response = self.api_app.handle_exception(e)
+            return response.status_code, response.content_type, _closing(response.response, response.close)
+
+        resp = self.session.get(
+            f"{self.base_url}{path}", stream=True,
+            timeout=(connect_timeout, STREAM_READ_TIMEOUT),
+        )
+        return (
+            resp.status_code,
+            resp.headers.get("Content-Type"),
+            _closing(resp.iter_content(chunk_size=None), resp.close),
+        )
+
+    def get(self, path: str, timeout=5):
+        return self.request("GET", path, timeout=timeout)
+
+    def post(self, path: str, payload: dict | None = None, timeout=5):
+        return self.request("POST", path, payload, timeout=timeout)
+
+
+class ApiDispatcher:
+    """
+    Tek süreçte iki WSGI app: /api ile başlayan yollar Boru API'ye,
+    diğerleri frontend'e (admin / web panel) gider.
+    """
+
+    def __init__(self, frontend_wsgi, api_wsgi, prefix: str = "/api"):
+        self.frontend_wsgi = frontend_wsgi
+        self.api_wsgi = api_wsgi
+        self.prefix = prefix
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        if path == self.prefix or path.startswith(self.prefix + "/"):
+            return self.api_wsgi(environ, start_response)
+        return self.frontend_wsgi(environ, start_response)
+
+
+def mount(frontend_app, client: BoruClient) -> None:
+    """Cohosted modda Boru API'yi frontend'in WSGI zincirine ekler."""
+    if client.cohosted:
+        frontend_app.wsgi_app = ApiDispatcher(frontend_app.wsgi_app, client.api_app.wsgi_app)
@@ -0,0 +1,190 @@
+"""
+core/allocation.py
+Master trade → follower emir miktarları (vektörel).
+
+Aktif aboneler NumPy dizileri olarak gelir (core.subscriber_snapshot);
+her master event için tüm follower'ların hedef miktarı, lot yuvarlaması
+ve atlanma sebebi tek geçişte (Python döngüsü olmadan) hesaplanır.
+
+Boyutlama:
+    master_weight = usd_amount / master_equity
+    target_usd    = master_weight * portfolio_value * allocation_pct/100 * risk_multiplier
+    qty           = floor(target_usd / price / lot_size) * lot_size
+"""
+import os
+import sqlite3
+
+import numpy as np
+
+SUBSCRIBERS_DB = os.path.join(os.path.dirname(os.path.dirname(__file__)), "admin_subscribers.db")
+
+MASTER_EQUITY = 100_000.0   # event'te master_equity yoksa kullanılır
+LOT_SIZE = 1.0              # event'te lot_size yoksa (hisse: 1 adet)
+MIN_ORDER_USD = 1.0         # bunun altındaki follower emirleri gönderilmez
+
+# Atlanma sebepleri (reason dizisindeki kodlar)
+OK = 0
+SKIP_NO_CAPITAL = 1
+SKIP_ZERO_ALLOCATION = 2
+SKIP_TIER = 3
+SKIP_DAILY_LOSS = 4
+SKIP_BELOW_LOT = 5
+SKIP_BELOW_MIN_USD = 6
+
+REASONS = {
+    OK: "OK",
+    SKIP_NO_CAPITAL: "NO_CAPITAL",
+    SKIP_ZERO_ALLOCATION: "ZERO_ALLOCATION",
+    SKIP_TIER: "TIER",
+    SKIP_DAILY_LOSS: "DAILY_LOSS_LIMIT",
+    SKIP_BELOW_LOT: "BELOW_LOT",
+    SKIP_BELOW_MIN_USD: "BELOW_MIN_USD",
+}
+
+ACTIVE_SQL = """
+SELECT id, broker, risk_multiplier, allocation_pct, portfolio_value, tier, daily_loss_limit
+FROM subscribers
+WHERE is_active = 1 AND (status IS NULL OR UPPER(status) = 'ACTIVE')
+ORDER BY id
+"""
+
+
+class Followers:
+    """Aktif abonelerin kolon bazlı (NumPy) görüntüsü."""
+
+    def __init__(self, rows: list):
+        n = len(rows)
+        self.ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=n)
+        self.brokers = [r[1] or "ibkr" for r in rows]
+        self.risk_multiplier = _column(rows, 2, 1.0)
+        self.allocation_pct = _column(rows, 3, 100.0)
+        self.portfolio_value = _column(rows, 4, 0.0)
+        self.tier = _column(rows, 5, 0.0)
+        self.daily_loss_limit = _column(rows, 6, 5.0)
+
+    @classmethod
+    def from_columns(cls, **cols) -> "Followers":
+        """Hazır kolon dizilerinden (ör. subscriber_snapshot) oluşturur."""
+        obj = cls.__new__(cls)
+        for name, value in cols.items():
+            setattr(obj, name, value)
+        return obj
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+def _column(rows: list, idx: int, default: float) -> np.ndarray:
+    col = np.fromiter(
+        (default if r[idx] is None else r[idx] for r in rows),
+        dtype=np.float64,
+        count=len(rows),
+    )
+    col[np.isnan(col)] = default
+    return col
+
+
+def load_followers(path: str = SUBSCRIBERS_DB) -> Followers:
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute(ACTIVE_SQL).fetchall()
+    finally:
+        conn.close()
+    return Followers(rows)
+
+
+class Allocation:
+    """Tek master event için follower bazında sonuç dizileri."""
+
+    def __init__(self, followers: Followers, qty, usd, reason, event: dict):
+        self.followers = followers
+        self.qty = qty
+        self.usd = usd
+        self.reason = reason
+        self.event = event
+
+    def orders(self) -> list:
+        """Gönderilecek (reason == OK) follower emirleri."""
+        idx = np.flatnonzero(self.reason == OK)
+        brokers = self.followers.brokers
+        symbol = self.event.get("symbol")
+        side = self.event.get("side")
+        master_id = self.event.get("master_trade_id")
+        # tolist(): eleman başına NumPy scalar dönüşümünden kaçın
+        return [
+            {
+                "subscriber_id": sub_id,
+                "broker": brokers[i],
+                "symbol": symbol,
+                "side": side,
+                "qty": qty,
+                "usd_amount": usd,
+                "master_trade_id": master_id,
+            }
+            for i, sub_id, qty, usd in zip(
+                idx.tolist(),
+                self.followers.ids[idx].tolist(),
+                self.qty[idx].tolist(),
+                np.round(self.usd[idx], 2).tolist(),
+            )
+        ]
+
+    def summary(self) -> dict:
+        counts = np.bincount(self.reason, minlength=len(REASONS))
+        return {
+            "followers": len(self.followers),
+            "orders": int(counts[OK]),
+            "total_qty": float(self.qty[self.reason == OK].sum()),
+            "skipped": {REASONS[code]: int(n) for code, n in enumerate(counts) if code != OK and n},
+        }
+
+
+def allocate(event: dict, followers: Followers, daily_loss_pct=None) -> Allocation:
+    """
+    event: master_event (symbol, side, price, usd_amount; opsiyonel
+           master_equity, lot_size, min_tier)
+    daily_loss_pct: follower sırasıyla bugünkü zarar yüzdesi (yoksa 0 kabul edilir)
+    """
+    n = len(followers)
+    price = float(event.get("price") or 0.0)
+    usd_amount = float(event.get("usd_amount") or 0.0)
+    master_equity = float(event.get("master_equity") or MASTER_EQUITY)
+    lot_size = float(event.get("lot_size") or LOT_SIZE)
+    min_tier = float(event.get("min_tier") or 0)
+
+    reason = np.zeros(n, dtype=np.int8)
+    if n == 0:
+        empty = np.zeros(0, dtype=np.float64)
+        return Allocation(followers, empty, empty, reason, event)
+    if price <= 0 or usd_amount <= 0:
+        raise ValueError(f"allocate: geçersiz price/usd_amount: {price}/{usd_amount}")
+
+    weight = usd_amount / master_equity
+    target_usd = (
+        weight
+        * followers.portfolio_value
+        * (followers.allocation_pct / 100.0)
+        * followers.risk_multiplier
+    )
+    qty = np.floor(target_usd / price / lot_size) * lot_size
+    order_usd = qty * price
+
+    if daily_loss_pct is None:
+        daily_loss_pct = np.zeros(n, dtype=np.float64)
+
+    # Sonra yazılan sebep baskın: en temel sebep (NO_CAPITAL) en sonda
+    checks = (
+        (order_usd < MIN_ORDER_USD, SKIP_BELOW_MIN_USD),
+        (qty <= 0, SKIP_BELOW_LOT),
+        (np.asarray(daily_loss_pct) >= followers.daily_loss_limit, SKIP_DAILY_LOSS),
+        (followers.tier < min_tier, SKIP_TIER),
+        ((followers.allocation_pct <= 0) | (followers.risk_multiplier <= 0), SKIP_ZERO_ALLOCATION),
+        (followers.portfolio_value <= 0, SKIP_NO_CAPITAL),
+    )
+    for mask, code in checks:
+        reason[mask] = code
+
+    skipped = reason != OK
+    qty[skipped] = 0.0
+    order_usd[skipped] = 0.0
+    return Allocation(followers, qty, order_usd, reason, event)
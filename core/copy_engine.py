@@ -1,6 +1,23 @@
+from .allocation import allocate
+from .fanout import FanoutExecutor
+from .subscriber_snapshot import subscribers
+
+# Follower emirleri broker bazında paralel, rate-limit'li gönderilir.
+fanout = FanoutExecutor()
+
+# IBKR follower'ları için henüz hesap / bağlantı bilgisi yok (subscribers
+# tablosunda IBKR hesabı tutulmuyor). Master bağlantısından göndermek emri
+# follower başına bir kez MASTER hesapta çalıştırır → gönderilmez, atlanır.
+fanout.disable("ibkr", "NO_FOLLOWER_IBKR_ACCOUNT")
+
+# Binance için de follower başına API anahtarı tutulmuyor; anahtarsız ortak
+# BinanceBroker stub'ı hiçbir şey göndermeden "pending" döner → atlanır.
+fanout.disable("binance", "NO_FOLLOWER_BINANCE_ACCOUNT")
+
+
 def enqueue(event: dict):
     print(f"[COPY_ENGINE] enqueue event: {event}")
-    process_master_trade(event)
+    return process_master_trade(event)
 
 
 def process_master_trade(event: dict):
@@ -9,7 +26,15 @@ def process_master_trade(event: dict):
     qty = event.get("qty")
     usd = event.get("usd_amount")
 
-    print(f"[COPY_ENGINE] (FAKE) would copy to followers: "
-          f"{symbol} {side} qty={qty} usd={usd}")
+    try:
+        allocation = allocate(event, subscribers.get().followers())
+    except Exception as e:
+        print(f"[COPY_ENGINE] allocation error: {symbol} {e}")
+        return None
+
+    summary = allocation.summary()
+    print(f"[COPY_ENGINE] {symbol} {side} qty={qty} usd={usd} → "
+          f"{summary['orders']}/{summary['followers']} follower, skipped={summary['skipped']}")
 
-    # TODO: Followers table, equity scaling, broker dispatch
+    # Beklemeden döner; sonuç ve copy gecikmesi job.summary() ile izlenir
+    return fanout.dispatch(event, allocation.orders())
@@ -0,0 +1,239 @@
+"""
+core/fanout.py
+Follower emirlerini broker'lara paralel dağıtan executor.
+
+- Emirler broker'a göre gruplanır (ibkr, binance ...); her broker'ın kendi
+  token bucket limiti vardır (API rate limit'lerini aşmamak için).
+- Her broker için SHARDS_PER_BROKER worker thread çalışır. Emir, abonenin
+  id'sine göre hep aynı shard'a düşer → aynı hesabın emirleri sırayla,
+  farklı hesaplarınki paralel gider.
+- Her follower emri için sinyalden (master_event["t_mono"], yoksa "ts")
+  itibaren geçen süre (copy gecikmesi) ölçülür; job özetinde p50 / p95 / max
+  olarak raporlanır ve latency histogramlarına (copy_ack / copy_fill) yazılır.
+- Follower emrini kendi hesabında çalıştıramayan broker'lar disable() ile
+  kapatılır; o broker'ın emirleri gönderilmez, job'a sebebiyle "skipped"
+  olarak yazılır (asla master hesaba düşmez).
+"""
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from latency import latency
+
+SHARDS_PER_BROKER = 8
+JOBS_KEEP = 100          # durumu hafızada tutulacak son fan-out job sayısı
+
+# broker → (saniyede emir, burst)
+BROKER_LIMITS = {
+    "ibkr": (45.0, 50),      # TWS API: ~50 mesaj/sn
+    "binance": (10.0, 20),
+}
+DEFAULT_LIMIT = (5.0, 10)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = float(rate)
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Bir token alana kadar bekler; beklenen süreyi (sn) döner."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return waited
+                delay = (1.0 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+def _parse_ts(ts) -> datetime:
+    try:
+        return datetime.fromisoformat(str(ts).rstrip("Z"))
+    except (TypeError, ValueError):
+        return datetime.utcnow()
+
+
+def _percentile(sorted_vals: list, pct: float):
+    if not sorted_vals:
+        return None
+    idx = min(len(sorted_vals) - 1, int(round(pct / 100.0 * (len(sorted_vals) - 1))))
+    return sorted_vals[idx]
+
+
+class FanoutJob:
+    """Tek master event'in follower dağıtımı."""
+
+    def __init__(self, master_event: dict, total: int):
+        self.master_trade_id = master_event.get("master_trade_id")
+        self.symbol = master_event.get("symbol")
+        self.master_ts = _parse_ts(master_event.get("ts"))
+        self.t_mono = master_event.get("t_mono")
+        self.portfolio = master_event.get("portfolio")
+        self.total = total
+        self.results = []
+        self.started_at = time.time()
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+        if total == 0:
+            self.done.set()
+
+    def record(self, order: dict, ok: bool, send_ms: int, result=None, error=None,
+               skipped: bool = False) -> None:
+        if self.t_mono is not None:
+            latency_ms = int((time.monotonic() - self.t_mono) * 1000)
+        else:
+            latency_ms = int((datetime.utcnow() - self.master_ts).total_seconds() * 1000)
+        if ok:
+            dims = {"broker": order.get("broker"), "portfolio": self.portfolio}
+            latency.observe("copy_ack", latency_ms, **dims)
+            order_id = result.get("order_id") if isinstance(result, dict) else result
+            latency.track_fill(order_id, "copy_fill", self.t_mono, **dims)
+        entry = {
+            "subscriber_id": order.get("subscriber_id"),
+            "broker": order.get("broker"),
+            "ok": ok,
+            "skipped": skipped,
+            "latency_ms": latency_ms,
+            "send_ms": send_ms,
+            "result": result,
+            "error": error,
+        }
+        with self._lock:
+            self.results.append(entry)
+            finished = len(self.results) >= self.total
+        if finished:
+            self.done.set()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self.done.wait(timeout)
+
+    def summary(self) -> dict:
+        with self._lock:
+            results = list(self.results)
+        latencies = sorted(r["latency_ms"] for r in results if not r["skipped"])
+        skipped = sum(1 for r in results if r["skipped"])
+        failed = sum(1 for r in results if not r["ok"] and not r["skipped"])
+        return {
+            "master_trade_id": self.master_trade_id,
+            "symbol": self.symbol,
+            "total": self.total,
+            "completed": len(results),
+            "failed": failed,
+            "skipped": skipped,
+            "done": self.done.is_set(),
+            "latency_ms": {
+                "p50": _percentile(latencies, 50),
+                "p95": _percentile(latencies, 95),
+                "max": latencies[-1] if latencies else None,
+            },
+        }
+
+
+class _BrokerPool:
+    """Tek broker: token bucket + abone id'sine göre shard'lanmış worker'lar."""
+
+    def __init__(self, name: str, send, rate: float, burst: int, shards: int):
+        self.name = name
+        self.send = send
+        self.bucket = TokenBucket(rate, burst)
+        self.metrics = {"sent": 0, "failed": 0, "throttled_ms": 0}
+        self._lock = threading.Lock()
+        self.queues = []
+        for i in range(shards):
+            q = queue.Queue()
+            self.queues.append(q)
+            threading.Thread(
+                target=self._run, args=(q,), name=f"fanout-{name}-{i}", daemon=True
+            ).start()
+
+    def put(self, order: dict, job: FanoutJob) -> None:
+        shard = hash(order.get("subscriber_id")) % len(self.queues)
+        self.queues[shard].put((order, job))
+
+    def _run(self, q: queue.Queue) -> None:
+        while True:
+            order, job = q.get()
+            waited = self.bucket.acquire()
+            started = time.monotonic()
+            try:
+                result = self.send(order)
+                # Sadece açıkça ok=True dönen gönderim başarılı sayılır
+                ok = isinstance(result, dict) and result.get("ok") is True
+                error = None if ok else (
+                    result.get("error") if isinstance(result, dict) else None
+                ) or "NOT_CONFIRMED"
+            except Exception as e:
+                print("fanout send error:", self.name, order.get("subscriber_id"), e)
+                result, ok, error = None, False, str(e)
+            send_ms = int((time.monotonic() - started) * 1000)
+            with self._lock:
+                self.metrics["sent" if ok else "failed"] += 1
+                self.metrics["throttled_ms"] += int(waited * 1000)
+            job.record(order, ok, send_ms, result=result, error=error)
+
+    def stats(self) -> dict:
+        with self._lock:
+            data = dict(self.metrics)
+        data["queued"] = sum(q.qsize() for q in self.queues)
+        data["rate"] = self.bucket.rate
+        return data
+
+
+class FanoutExecutor:
+    def __init__(self, shards: int = SHARDS_PER_BROKER):
+        self.shards = shards
+        self._pools = {}
+        self._disabled = {}      # broker → sebep
+        self._jobs = deque(maxlen=JOBS_KEEP)
+
+    def register(self, broker: str, send, rate: float | None = None, burst: int | None = None) -> None:
+        """
+        send(order) → sonuç; order: allocation.orders() elemanı
+        (subscriber_id, broker, symbol, side, qty, usd_amount, master_trade_id)
+        """
+        self._disabled.pop(broker, None)
+        default_rate, default_burst = BROKER_LIMITS.get(broker, DEFAULT_LIMIT)
+        self._pools[broker] = _BrokerPool(
+            broker, send, rate or default_rate, burst or default_burst, self.shards
+        )
+
+    def disable(self, broker: str, reason: str) -> None:
+        """broker'ın follower emirlerini göndermeden `reason` ile atlar."""
+        self._disabled[broker] = reason
+
+    def dispatch(self, master_event: dict, orders: list) -> FanoutJob:
+        """Emirleri broker kuyruklarına bırakır ve hemen döner (job.wait ile beklenebilir)."""
+        job = FanoutJob(master_event, len(orders))
+        self._jobs.append(job)
+        for order in orders:
+            broker = str(order.get("broker") or "").lower()
+            reason = self._disabled.get(broker)
+            if reason is not None:
+                job.record(order, False, 0, error=reason, skipped=True)
+                continue
+            pool = self._pools.get(broker)
+            if pool is None:
+                job.record(order, False, 0, error=f"broker not registered: {order.get('broker')}")
+                continue
+            pool.put(order, job)
+        return job
+
+    def jobs(self) -> list:
+        return [job.summary() for job in list(self._jobs)]
+
+    def stats(self) -> dict:
+        data = {name: pool.stats() for name, pool in self._pools.items()}
+        for name, reason in self._disabled.items():
+            data[name] = {"disabled": reason}
+        return data
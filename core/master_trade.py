@@ -1,22 +1,47 @@
+import time
 from uuid import uuid4
 from datetime import datetime
 from . import copy_engine
+from latency import latency
 
 
 def now_iso():
     return datetime.utcnow().isoformat()
 
 
-def place_master_trade(broker, symbol, side, usd_amount, meta=None):
+def broker_name(broker) -> str:
+    """IBKRBroker → "ibkr", BinanceBroker → "binance" (gecikme boyutu için)."""
+    name = getattr(broker, "name", None) or type(broker).__name__
+    return str(name).lower().replace("broker", "") or "unknown"
+
+
+def place_master_trade(broker, symbol, side, usd_amount, meta=None, max_price_age=None):
+    """
+    max_price_age: fiyat için kabul edilen max bayatlık (sn).
+    None → broker'ın varsayılanı (cache'li broker'larda dict lookup).
+    """
     if meta is None:
         meta = {}
 
     side = side.upper()  # BUY / SELL
 
-    price = broker.get_price(symbol)
+    # Gecikme ölçümü: sinyalin alındığı an (yoksa şimdi)
+    t_mono = meta.get("t_mono") or time.monotonic()
+    dims = {"broker": broker_name(broker), "portfolio": meta.get("portfolio")}
+    latency.since("master_queue", t_mono, **dims)
+
+    if max_price_age is None:
+        price = broker.get_price(symbol)
+    else:
+        price = broker.get_price(symbol, max_age=max_price_age)
     if not price or price <= 0:
         raise RuntimeError(f"Price not found: {symbol}, price={price}")
 
+    price_age_ms = None
+    if hasattr(broker, "price_age"):
+        age = broker.price_age(symbol)
+        price_age_ms = int(age * 1000) if age is not None else None
+
     qty = usd_amount / price
 
     if hasattr(broker, "adjust_quantity"):
@@ -31,6 +56,8 @@ def place_master_trade(broker, symbol, side, usd_amount, meta=None):
         quantity=qty,
         order_type="MKT"
     )
+    latency.since("master_ack", t_mono, **dims)
+    latency.track_fill(order_id, "master_fill", t_mono, **dims)
 
     master_event = {
         "event_type": "MASTER_TRADE",
@@ -38,10 +65,14 @@ def place_master_trade(broker, symbol, side, usd_amount, meta=None):
         "side": side,
         "qty": qty,
         "price": price,
+        "price_age_ms": price_age_ms,
         "usd_amount": usd_amount,
         "source": meta.get("source"),
         "strategy": meta.get("strategy"),
         "signal_id": meta.get("signal_id"),
+        "portfolio": meta.get("portfolio"),
+        "broker": dims["broker"],
+        "t_mono": t_mono,
         "ts": now_iso(),
         "order_id": order_id,
         "master_trade_id": uuid4().hex,
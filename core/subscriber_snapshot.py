@@ -0,0 +1,270 @@
+"""
+core/subscriber_snapshot.py
+admin_subscribers.db'nin hafızadaki kolon bazlı (NumPy) kopyası.
+
+Copy engine, risk kontrolleri ve admin abone ekranları aboneleri buradan
+okur; her karar için DB sorgulanmaz.
+
+- Snapshot değişmez (immutable): yenileme yeni bir snapshot üretir ve tek
+  atamayla yerine koyar. Okuyucular hiç kilit beklemez.
+- Yenileme artımlıdır: sadece id > rowid_watermark (yeni abone) veya
+  last_sync_time > sync_watermark (güncellenen abone) satırları okunur.
+- Silinen / last_sync_time güncellenmeden değiştirilen satırlar için
+  satır sayısı tutmazsa ya da FULL_RELOAD_INTERVAL dolunca tam yükleme yapılır.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from .allocation import SUBSCRIBERS_DB, Followers
+
+CHECK_INTERVAL = 1.0          # DB mtime kontrolü arası min süre (sn)
+FULL_RELOAD_INTERVAL = 300.0  # watermark'ların yakalayamadığı değişiklikler için
+
+# (kolon, tip, varsayılan) — "f": float64 dizi, "s": object dizi
+COLUMNS = (
+    ("id", "i", 0),
+    ("name", "s", None),
+    ("email", "s", None),
+    ("broker", "s", "ibkr"),
+    ("risk_multiplier", "f", 1.0),
+    ("allocation_pct", "f", 100.0),
+    ("portfolio_value", "f", 0.0),
+    ("tier", "f", 0.0),
+    ("daily_loss_limit", "f", 5.0),
+    ("drift_pct", "f", 0.0),
+    ("is_active", "i", 1),
+    ("status", "s", "ACTIVE"),
+    ("plan", "s", None),
+    ("last_sync_time", "s", None),
+)
+COLUMN_NAMES = [c[0] for c in COLUMNS]
+SELECT_SQL = "SELECT " + ", ".join(COLUMN_NAMES) + " FROM subscribers"
+
+
+def _build_column(values: list, kind: str, default):
+    if kind == "s":
+        arr = np.empty(len(values), dtype=object)
+        arr[:] = [default if v is None else v for v in values]
+        return arr
+    dtype = np.int64 if kind == "i" else np.float64
+    arr = np.fromiter(
+        (default if v is None else v for v in values), dtype=dtype, count=len(values)
+    )
+    if kind == "f":
+        arr[np.isnan(arr)] = default
+    return arr
+
+
+def _build_columns(rows: list) -> dict:
+    cols = {}
+    for idx, (name, kind, default) in enumerate(COLUMNS):
+        cols[name] = _build_column([r[idx] for r in rows], kind, default)
+    return cols
+
+
+class SubscriberSnapshot:
+    """Belirli bir andaki tüm abonelerin kolon dizileri (salt-okunur)."""
+
+    def __init__(self, cols: dict, version: int, rowid_watermark: int, sync_watermark: str | None):
+        self.cols = cols
+        self.version = version
+        self.loaded_at = time.time()
+        self.rowid_watermark = rowid_watermark
+        self.sync_watermark = sync_watermark
+        self.index = {sub_id: pos for pos, sub_id in enumerate(cols["id"].tolist())}
+        status = np.array([str(s).upper() for s in cols["status"]], dtype=object)
+        self.active = (cols["is_active"] == 1) & (status == "ACTIVE")
+        self._followers = None
+
+    def __len__(self) -> int:
+        return len(self.cols["id"])
+
+    def followers(self) -> Followers:
+        """Aktif abonelerin allocation girdisi (snapshot başına bir kez üretilir)."""
+        if self._followers is None:
+            mask = self.active
+            self._followers = Followers.from_columns(
+                ids=self.cols["id"][mask],
+                brokers=self.cols["broker"][mask].tolist(),
+                risk_multiplier=self.cols["risk_multiplier"][mask],
+                allocation_pct=self.cols["allocation_pct"][mask],
+                portfolio_value=self.cols["portfolio_value"][mask],
+                tier=self.cols["tier"][mask],
+                daily_loss_limit=self.cols["daily_loss_limit"][mask],
+            )
+        return self._followers
+
+    def get(self, sub_id: int) -> dict | None:
+        pos = self.index.get(int(sub_id))
+        if pos is None:
+            return None
+        return {name: _py(self.cols[name][pos]) for name in COLUMN_NAMES}
+
+    def rows(self, active_only: bool = False, offset: int = 0, limit: int | None = None) -> list:
+        """Admin ekranları için satır listesi (id sırasıyla)."""
+        positions = np.flatnonzero(self.active) if active_only else np.arange(len(self))
+        positions = positions[offset: None if limit is None else offset + limit]
+        lists = {name: self.cols[name][positions].tolist() for name in COLUMN_NAMES}
+        return [dict(zip(COLUMN_NAMES, values)) for values in zip(*lists.values())]
+
+    def stats(self) -> dict:
+        return {
+            "total": len(self),
+            "active": int(self.active.sum()),
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "rowid_watermark": self.rowid_watermark,
+            "sync_watermark": self.sync_watermark,
+        }
+
+
+def _py(val):
+    return val.item() if isinstance(val, np.generic) else val
+
+
+class SubscriberBook:
+    def __init__(self, path: str = SUBSCRIBERS_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._snapshot: SubscriberSnapshot | None = None
+        self._mtime = None
+        self._last_check = 0.0
+        self._last_full = 0.0
+        self._stats = {"full_reloads": 0, "incremental": 0, "rows_applied": 0, "errors": 0}
+
+    def get(self) -> SubscriberSnapshot:
+        """
+        Güncel snapshot. İlk çağrı yükleme yapar; sonrasında değişiklik
+        varsa yenileme arka planda yapılır, çağıran mevcut snapshot'ı alır.
+        """
+        snap = self._snapshot
+        if snap is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._refresh()
+            return self._snapshot
+
+        now = time.monotonic()
+        if now - self._last_check >= CHECK_INTERVAL and self._lock.acquire(blocking=False):
+            # Kilit yenileme thread'ine devredilir; thread başlamazsa (değişiklik
+            # yok ya da stat / thread hatası) her durumda burada bırakılır
+            handed_off = False
+            try:
+                self._last_check = now
+                if self._changed() or now - self._last_full >= FULL_RELOAD_INTERVAL:
+                    threading.Thread(
+                        target=self._refresh_locked, name="subscriber-refresh", daemon=True
+                    ).start()
+                    handed_off = True
+            finally:
+                if not handed_off:
+                    self._lock.release()
+        return snap
+
+    def refresh(self, full: bool = False) -> SubscriberSnapshot:
+        """Senkron yenileme (admin işlemlerinden sonra)."""
+        with self._lock:
+            self._refresh(full=full)
+        return self._snapshot
+
+    def _changed(self) -> bool:
+        try:
+            return os.stat(self.path).st_mtime_ns != self._mtime
+        except FileNotFoundError:
+            return False
+
+    def _refresh_locked(self) -> None:
+        try:
+            self._refresh()
+        finally:
+            self._lock.release()
+
+    def _refresh(self, full: bool = False) -> None:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            if self._snapshot is None:
+                self._snapshot = SubscriberSnapshot(_build_columns([]), 0, 0, None)
+            return
+
+        conn = sqlite3.connect(self.path)
+        try:
+            base = self._snapshot
+            full = (
+                full
+                or base is None
+                or time.monotonic() - self._last_full >= FULL_RELOAD_INTERVAL
+            )
+            if full:
+                snap = self._full(conn, base)
+            else:
+                snap = self._incremental(conn, base)
+            self._mtime = mtime
+            self._snapshot = snap
+        except Exception as e:
+            self._stats["errors"] += 1
+            print("subscriber_snapshot refresh error:", e)
+            if self._snapshot is None:
+                self._snapshot = SubscriberSnapshot(_build_columns([]), 0, 0, None)
+        finally:
+            conn.close()
+
+    def _full(self, conn, base) -> SubscriberSnapshot:
+        rows = conn.execute(SELECT_SQL + " ORDER BY id").fetchall()
+        self._last_full = time.monotonic()
+        self._stats["full_reloads"] += 1
+        return SubscriberSnapshot(
+            _build_columns(rows),
+            (base.version + 1) if base else 1,
+            max((r[0] for r in rows), default=0),
+            max((r[-1] for r in rows if r[-1]), default=None),
+        )
+
+    def _incremental(self, conn, base: SubscriberSnapshot) -> SubscriberSnapshot:
+        rows = conn.execute(
+            SELECT_SQL + " WHERE id > ? OR (last_sync_time IS NOT NULL AND last_sync_time > ?)"
+            " ORDER BY id",
+            (base.rowid_watermark, base.sync_watermark or ""),
+        ).fetchall()
+        (count,) = conn.execute("SELECT COUNT(*) FROM subscribers").fetchone()
+
+        new_rows = [r for r in rows if r[0] not in base.index]
+        if len(base) + len(new_rows) != count:
+            # Silinmiş satır var: watermark ile yakalanamaz
+            return self._full(conn, base)
+        if not rows:
+            return base
+
+        cols = {name: arr.copy() for name, arr in base.cols.items()}
+        for row in rows:
+            pos = base.index.get(row[0])
+            if pos is None:
+                continue
+            for idx, (name, _kind, default) in enumerate(COLUMNS):
+                cols[name][pos] = default if row[idx] is None else row[idx]
+        if new_rows:
+            added = _build_columns(new_rows)
+            cols = {name: np.concatenate([cols[name], added[name]]) for name in COLUMN_NAMES}
+
+        self._stats["incremental"] += 1
+        self._stats["rows_applied"] += len(rows)
+        return SubscriberSnapshot(
+            cols,
+            base.version + 1,
+            max(base.rowid_watermark, max(r[0] for r in rows)),
+            max([base.sync_watermark or ""] + [r[-1] for r in rows if r[-1]]) or None,
+        )
+
+    def stats(self) -> dict:
+        data = dict(self._stats)
+        if self._snapshot is not None:
+            data.update(self._snapshot.stats())
+        return data
+
+
+# Global tek instance
+subscribers = SubscriberBook()
@@ -0,0 +1,54 @@
+"""
+etag.py
+Okuma endpoint'leri için ETag / If-None-Match (conditional GET).
+
+ETag, cevabın içeriğinden (hash) değil verinin sürümünden üretilir
+(ReadCache version'ı, orders tablosunun son id'si ...). Böylece istemcinin
+elindeki sürüm güncelse cevap hiç üretilmez / JSON'a çevrilmez, gövdesiz
+304 döner. Sürüm sayaçları süreç yeniden başlayınca sıfırlandığı için
+ETag'e süreç başına rastgele BOOT_ID eklenir.
+
+Gövdedeki cache meta alanları (age_ms, cached ...) sürüm değiştirmediği
+için ETag'ler weak (W/"...") üretilir.
+"""
+import hashlib
+from uuid import uuid4
+
+from flask import Response, jsonify, request
+
+BOOT_ID = uuid4().hex[:8]
+
+# boru_client cohosted çağrılarında request.environ'a konan işaret
+LOCAL_ENVIRON_KEY = "boru_client.local"
+
+
+def make(*parts) -> str:
+    """Sürüm parçalarından (kaynak adı, mod, version, sorgu parametreleri ...) ETag."""
+    digest = hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=8).hexdigest()
+    return f"{BOOT_ID}-{digest}"
+
+
+def respond(tag: str | None, build):
+    """
+    tag istemcinin If-None-Match'inde varsa 304 döner, build() hiç çağrılmaz.
+    Yoksa build() → dict ya da (dict, status); 200 cevaplara ETag eklenir.
+    tag None ise (sürüm bilinmiyor / hata) normal cevap döner.
+    Süreç içi (cohosted) çağrıda ETag anlamsız: build() sonucu olduğu gibi
+    (JSON'a çevrilmeden) döner.
+    """
+    if request.environ.get(LOCAL_ENVIRON_KEY):
+        return build()
+    if tag is not None and request.if_none_match.contains_weak(tag):
+        response = Response(status=304)
+    else:
+        data = build()
+        data, status = data if isinstance(data, tuple) else (data, 200)
+        response = jsonify(data)
+        response.status_code = status
+        if status != 200:
+            return response
+    if tag is not None:
+        response.set_etag(tag, weak=True)
+        # Tarayıcı saklasın ama her seferinde sürüm sorsun
+        response.headers["Cache-Control"] = "no-cache"
+    return response
@@ -0,0 +1,203 @@
+"""
+event_stream.py
+Server-Sent Events (/api/stream) yayını.
+
+Tek bir producer thread kayıtlı kaynakları (hesap, pozisyonlar, mod)
+POLL_INTERVAL'da bir okur ve sadece içerik değiştiyse yayınlar; emir
+durumları gibi olaylar publish() ile anında itilir. Böylece upstream
+(IBKR) okuma sayısı açık sekme / istemci sayısından bağımsızdır.
+Bağlı istemci yoksa producer uyur, hiç okuma yapmaz.
+
+- Her olay yayın anında bir kez SSE metnine çevrilir, tüm istemciler
+  aynı string'i paylaşır (istemci başına JSON encode yok).
+- Her istemcinin sınırlı bir tamponu (CLIENT_BUFFER) vardır. Yavaş
+  istemci producer'ı bekletmez: tampon dolarsa en eski olay düşer ve
+  istemciye "lagged" olayı gider (arayüz tam veriyi yeniden çeker).
+- Yeni bağlanan istemci her kaynağın son halini hemen alır.
+- HEARTBEAT saniyede bir yorum satırı (": ping") gönderilir; proxy'ler
+  bağlantıyı kapatmaz, kopan istemci de yazma hatasıyla temizlenir.
+"""
+import json
+import threading
+import time
+from collections import deque
+
+POLL_INTERVAL = 2.0      # kaynak okuma aralığı (sn) — IBKRClient cache ttl'i ile aynı
+HEARTBEAT = 15.0         # olay yoksa ping aralığı (sn)
+CLIENT_BUFFER = 50       # istemci başına bekleyebilecek max olay
+MAX_CLIENTS = 100
+RETRY_MS = 3000          # EventSource yeniden bağlanma süresi
+
+# Karşılaştırmada yok sayılan alanlar (her okumada değişen cache meta'sı)
+VOLATILE_KEYS = ("cached", "age_ms", "stale", "refresh_error")
+
+
+class TooManyClients(Exception):
+    pass
+
+
+def _format(seq: int, name: str, data) -> str:
+    body = json.dumps(data, default=str, separators=(",", ":"))
+    return f"id: {seq}\nevent: {name}\ndata: {body}\n\n"
+
+
+def _fingerprint(data) -> str:
+    if isinstance(data, dict):
+        data = {k: v for k, v in data.items() if k not in VOLATILE_KEYS}
+    return json.dumps(data, default=str, sort_keys=True)
+
+
+class _Client:
+    def __init__(self, initial: list):
+        self.cond = threading.Condition()
+        self.buffer = deque(initial, maxlen=CLIENT_BUFFER)
+        self.dropped = 0
+        self.connected_at = time.time()
+
+    def push(self, message: str) -> bool:
+        """Olayı tampona ekler; tampon doluysa en eskisi düşer (False döner)."""
+        with self.cond:
+            full = len(self.buffer) == self.buffer.maxlen
+            if full:
+                self.dropped += 1
+            self.buffer.append(message)
+            self.cond.notify()
+        return not full
+
+    def next(self, timeout: float) -> tuple[list, int]:
+        """Bekleyen olayları (ve bu arada düşen olay sayısını) döner."""
+        with self.cond:
+            if not self.buffer:
+                self.cond.wait(timeout)
+            messages = list(self.buffer)
+            self.buffer.clear()
+            dropped, self.dropped = self.dropped, 0
+        return messages, dropped
+
+
+class EventHub:
+    def __init__(self, poll_interval: float = POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._clients = set()
+        self._sources = {}       # name → fn() → JSON'a çevrilebilir veri
+        self._last = {}          # name → (fingerprint, formatted message)
+        self._seq = 0
+        self._wake = threading.Event()
+        self._thread = None
+        self._stats = {"published": 0, "dropped": 0, "source_errors": 0}
+
+    # ---------------- Kaynak / yayın ----------------
+
+    def add_source(self, name: str, fn) -> None:
+        """Producer'ın periyodik okuyacağı kaynak; değişince `name` olayı yayınlanır."""
+        self._sources[name] = fn
+
+    def _next_message(self, name: str, data) -> str:
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+        return _format(seq, name, data)
+
+    def publish(self, name: str, data) -> None:
+        """Olayı bağlı tüm istemcilere iter (bağlı istemci yoksa hiçbir şey yapmaz)."""
+        if not self._clients:
+            return
+        self._broadcast(self._next_message(name, data))
+
+    def _publish_state(self, name: str, data) -> None:
+        fingerprint = _fingerprint(data)
+        with self._lock:
+            last = self._last.get(name)
+            if last is not None and last[0] == fingerprint:
+                return
+        message = self._next_message(name, data)
+        with self._lock:
+            self._last[name] = (fingerprint, message)
+        self._broadcast(message)
+
+    def _broadcast(self, message: str) -> None:
+        with self._lock:
+            clients = list(self._clients)
+            self._stats["published"] += 1
+        dropped = sum(0 if client.push(message) else 1 for client in clients)
+        if dropped:
+            with self._lock:
+                self._stats["dropped"] += dropped
+
+    # ---------------- Producer ----------------
+
+    def _ensure_producer(self) -> None:
+        # Aynı anda bağlanan iki istemci iki producer başlatmasın
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="event-stream", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                idle = not self._clients
+                if idle:
+                    # Dinleyen yok: okuma yapma, son durumu da unut
+                    # (yeni istemci bayat snapshot almasın)
+                    self._last.clear()
+            if idle:
+                self._wake.wait()
+            self._wake.clear()
+            for name, fn in list(self._sources.items()):
+                try:
+                    data = fn()
+                except Exception as e:
+                    print("event_stream source error:", name, e)
+                    with self._lock:
+                        self._stats["source_errors"] += 1
+                    continue
+                self._publish_state(name, data)
+            self._wake.wait(self.poll_interval)
+
+    # ---------------- İstemciler ----------------
+
+    def subscribe(self) -> _Client:
+        with self._lock:
+            if len(self._clients) >= MAX_CLIENTS:
+                raise TooManyClients(f"max {MAX_CLIENTS} stream istemcisi")
+            client = _Client([message for _, message in self._last.values()])
+            self._clients.add(client)
+        self._ensure_producer()
+        if not client.buffer:
+            self._wake.set()     # snapshot yok → producer hemen okusun
+        return client
+
+    def unsubscribe(self, client: _Client) -> None:
+        with self._lock:
+            self._clients.discard(client)
+
+    def stream(self, client: _Client):
+        """
+        Flask Response'a verilecek generator. request context'e dokunmaz;
+        istemci kopunca (GeneratorExit) aboneliği kapatır.
+        """
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            while True:
+                messages, dropped = client.next(HEARTBEAT)
+                if dropped:
+                    yield self._next_message("lagged", {"dropped": dropped})
+                if not messages:
+                    yield ": ping\n\n"
+                for message in messages:
+                    yield message
+        finally:
+            self.unsubscribe(client)
+
+    def stats(self) -> dict:
+        with self._lock:
+            data = dict(self._stats)
+            data["clients"] = len(self._clients)
+        data["sources"] = list(self._sources)
+        return data
+
+
+# Global tek instance (/api/stream)
+events = EventHub()
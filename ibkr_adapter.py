@@ -1,150 +1,488 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple
 
 import asyncio
-from ib_insync import IB
+import concurrent.futures
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from ib_insync import IB, Stock
 
 from admin_mode import get_ib_target, get_admin_mode
+from latency import latency
+
+
+# ----------------------------------------
+# Broker thread ayarları
+# ----------------------------------------
+REQUEST_TIMEOUT = 10.0     # Flask handler'ın broker cevabını bekleyeceği max süre (sn)
+CONNECT_TIMEOUT = 4.0      # ib.connect() için timeout (sn)
+RECONNECT_INTERVAL = 5.0   # Başarısız bağlantıdan sonra tekrar denemeden önce beklenecek süre
+IDLE_SLEEP = 0.02          # Kuyruk boşken ib_insync loop'unun döndürüleceği süre
+
+# ----------------------------------------
+# Piyasa verisi cache ayarları
+# ----------------------------------------
+PRICE_MAX_AGE = 2.0        # get_price() varsayılan max bayatlık (sn)
+STREAM_PRICES = True       # İlk fiyat sorgusundan sonra sembole streaming abone ol
+
+
+def _to_float(val: str | None) -> float:
+    try:
+        return float(val) if val else 0.0
+    except ValueError:
+        return 0.0
 
 
-def ensure_event_loop() -> None:
+class AccountSnapshot(NamedTuple):
     """
-    Flask her request'i ayrı thread'de çalıştırdığı için,
-    o thread'de bir asyncio event loop yoksa ib_insync hata veriyor:
+    Broker thread'inin yayınladığı değişmez hesap görüntüsü.
+    Tüm alanlar aynı anda üretilir; okuyucu tek referansla tutarlı
+    (version / updated_at / account / positions / connected) bir set alır.
+    """
+    version: int
+    updated_at: float | None
+    connected: bool
+    account: Dict[str, Any]
+    positions: Tuple[Dict[str, Any], ...]
 
-        "There is no current event loop in thread 'Thread-1 (...)'"
 
-    Bu fonksiyon, içinde çağrıldığı thread'e bir event loop atıyor.
+class AccountStore:
     """
-    try:
-        asyncio.get_event_loop()
-    except RuntimeError:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+    ib_insync event'leri (accountValueEvent / positionEvent) ile güncel
+    tutulan hesap + pozisyon hafızası.
+
+    Yazma sadece broker thread'inden yapılır; her güncellemede yeni bir
+    AccountSnapshot üretilip tek atamayla `snapshot`a konur (copy-on-write).
+    Okuyucular (Flask thread'leri) sadece `snapshot`ı okur: kilitsiz, O(1)
+    ve yırtılmasız (alanlar ayrı ayrı okunmaz). Bağlantı durumu da
+    snapshot'tadır; Flask thread'leri IB() nesnesine hiç dokunmaz.
+    """
+
+    def __init__(self) -> None:
+        self._values: Dict[str, str] = {}
+        self._account: str | None = None
+        self._positions: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        self._account_view: Dict[str, Any] = self._build_account()
+        self._positions_view: Tuple[Dict[str, Any], ...] = ()
+        self.snapshot = AccountSnapshot(0, None, False, self._account_view, ())
+
+    def _build_account(self) -> Dict[str, Any]:
+        data = self._values
+        return {
+            "account_id": data.get("Account") or self._account or "N/A",
+            "equity": _to_float(data.get("NetLiquidation")),
+            "cash": _to_float(data.get("AvailableFunds")),
+            "buying_power": _to_float(data.get("BuyingPower")),
+            "currency": data.get("Currency", "USD"),
+        }
+
+    def _publish(self, connected: bool | None = None) -> None:
+        prev = self.snapshot
+        self.snapshot = AccountSnapshot(
+            version=prev.version + 1,
+            updated_at=time.time(),
+            connected=prev.connected if connected is None else connected,
+            account=self._account_view,
+            positions=self._positions_view,
+        )
+
+    # ---------------- Broker thread tarafı ----------------
+
+    def reset(self, values: List[Any], positions: List[Any]) -> None:
+        """(Yeniden) bağlantı sonrası tam senkron: tüm hafızayı baştan kurar."""
+        self._values = {}
+        self._positions = {}
+        for v in values:
+            self._apply_value(v)
+        for p in positions:
+            self._apply_position(p)
+        self._account_view = self._build_account()
+        self._positions_view = tuple(self._positions.values())
+        self._publish(connected=True)
+
+    def set_connected(self, connected: bool) -> None:
+        if connected != self.snapshot.connected:
+            self._publish(connected=connected)
+
+    def _apply_value(self, v: Any) -> bool:
+        if v.account:
+            self._account = v.account
+        if self._values.get(v.tag) == v.value:
+            return False
+        self._values[v.tag] = v.value
+        return True
+
+    def _apply_position(self, p: Any) -> None:
+        key = (p.account, p.contract.conId)
+        if not p.position:
+            self._positions.pop(key, None)
+            return
+        self._positions[key] = {
+            "symbol": p.contract.symbol,
+            "secType": p.contract.secType,
+            "position": float(p.position),
+            "avg_cost": float(p.avgCost),
+        }
+
+    def on_account_value(self, v: Any) -> None:
+        if self._apply_value(v):
+            self._account_view = self._build_account()
+            self._publish()
+
+    def on_position(self, p: Any) -> None:
+        self._apply_position(p)
+        self._positions_view = tuple(self._positions.values())
+        self._publish()
+
+
+class MarketDataCache:
+    """
+    Sembol bazlı qualified contract + son fiyat hafızası.
+
+    - Contract'lar bir kez qualify edilir ve süreç boyunca tutulur.
+    - Fiyatlar streaming (pendingTickersEvent) ya da snapshot ile güncellenir;
+      okuma bir dict lookup'tır, bayatlık çağıran tarafından belirlenir.
+    Yazma sadece broker thread'inden yapılır (AccountStore ile aynı kural).
+    """
+
+    def __init__(self) -> None:
+        self.contracts: Dict[str, Any] = {}
+        self.streaming: Dict[str, Any] = {}
+        self._prices: Dict[str, Tuple[float, float]] = {}
+        self._by_con_id: Dict[int, str] = {}
+
+    # ---------------- Okuma (her thread) ----------------
+
+    def price(self, symbol: str, max_age: float) -> float | None:
+        """max_age saniyeden taze fiyat varsa döner, yoksa None."""
+        entry = self._prices.get(symbol)
+        if entry is None:
+            return None
+        price, ts = entry
+        if time.monotonic() - ts > max_age:
+            return None
+        return price
+
+    def age(self, symbol: str) -> float | None:
+        entry = self._prices.get(symbol)
+        return None if entry is None else time.monotonic() - entry[1]
+
+    # ---------------- Broker thread tarafı ----------------
+
+    def add_contract(self, symbol: str, contract: Any) -> None:
+        self.contracts[symbol] = contract
+        self._by_con_id[contract.conId] = symbol
+
+    def set_price(self, symbol: str, price: float) -> bool:
+        # NaN / 0 / negatif fiyatlar cache'e girmez
+        if price is None or price != price or price <= 0:
+            return False
+        self._prices[symbol] = (float(price), time.monotonic())
+        return True
+
+    def on_tickers(self, tickers: Any) -> None:
+        for t in tickers:
+            symbol = self._by_con_id.get(t.contract.conId)
+            if symbol is not None:
+                self.set_price(symbol, t.marketPrice())
 
 
 class IBKRBroker:
+    """
+    IB() nesnesinin ve ib_insync event loop'unun TEK sahibi olan
+    "ibkr-broker" thread'i etrafında ince bir sarmalayıcı.
+
+    Eskiden her Flask thread'i kendi event loop'unu kurup aynı IB()
+    nesnesine dokunuyordu. Artık:
+      - IB() ve loop, süreç boyunca yaşayan broker thread'inde oluşur,
+      - Flask handler'ları işi thread-safe kuyruğa bırakır (submit),
+      - cevabı Future üzerinden timeout ile bekler.
+    Böylece tüm HTTP istekleri tek, sıcak soketi paylaşır.
+    """
+
     def __init__(self) -> None:
-        # IB nesnesini ana thread'de oluşturuyoruz
-        ensure_event_loop()
-        self.ib = IB()
+        self.ib: IB | None = None
         self.host: str = "127.0.0.1"
         self.port: int = 7496
         self.client_id: int = 1
 
-    # ---------------- Helpers ----------------
+        self._jobs: "queue.Queue[Tuple[Callable[..., Any], tuple, Future]]" = queue.Queue()
+        self._ready = threading.Event()
+        self._stopping = False
+        self._want_connected = False
+        self._last_connect_attempt = 0.0
+        self._last_connect_error: str | None = None
+        self.store = AccountStore()
+        self.market = MarketDataCache()
+
+        self._thread = threading.Thread(
+            target=self._run, name="ibkr-broker", daemon=True
+        )
+        self._thread.start()
+        self._ready.wait()
+
+    # ---------------- Broker thread ----------------
+
+    def _run(self) -> None:
+        """Broker thread ana döngüsü: kuyruktaki işleri sırayla çalıştırır."""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self.ib = IB()
+        self.ib.accountValueEvent += self.store.on_account_value
+        self.ib.positionEvent += self.store.on_position
+        self.ib.pendingTickersEvent += self.market.on_tickers
+        self.ib.disconnectedEvent += lambda: self.store.set_connected(False)
+        # Fill gecikmesi: latency.track_fill ile kaydedilen emirler
+        self.ib.execDetailsEvent += lambda trade, fill: latency.on_fill(trade.order.orderId)
+        self._ready.set()
+
+        while not self._stopping:
+            try:
+                fn, args, fut = self._jobs.get_nowait()
+            except queue.Empty:
+                self._idle()
+                continue
+
+            # Handler timeout'a düşüp iptal ettiyse boşuna çalıştırma
+            if not fut.set_running_or_notify_cancel():
+                continue
+            try:
+                fut.set_result(fn(*args))
+            except BaseException as e:  # noqa: BLE001
+                fut.set_exception(e)
+
+    def _idle(self) -> None:
+        """
+        Kuyruk boşken loop'u döndürür (IB mesajları işlensin diye)
+        ve bağlantı koptuysa arka planda yeniden bağlanmayı dener.
+        """
+        try:
+            connected = self.ib.isConnected()
+            self.store.set_connected(connected)
+            if self._want_connected and not connected:
+                if time.monotonic() - self._last_connect_attempt >= RECONNECT_INTERVAL:
+                    self._connect()
+            self.ib.sleep(IDLE_SLEEP)
+        except Exception as e:  # noqa: BLE001
+            print("ibkr-broker idle error:", e)
+            time.sleep(IDLE_SLEEP)
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> Future:
+        """İşi broker thread kuyruğuna bırakır, sonucu Future olarak döner."""
+        fut: Future = Future()
+        self._jobs.put((fn, args, fut))
+        return fut
+
+    def _call(self, fn: Callable[..., Any], *args: Any, timeout: float = REQUEST_TIMEOUT) -> Any:
+        """submit() + timeout ile bekle. Broker thread içinden çağrılırsa direkt çalıştırır."""
+        if threading.current_thread() is self._thread:
+            return fn(*args)
+        fut = self.submit(fn, *args)
+        try:
+            return fut.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:   # 3.10'da builtin TimeoutError değil
+            fut.cancel()
+            raise
+
+    def stop(self) -> None:
+        """Broker thread'ini durdurur (test / kapatma için)."""
+        def _shutdown() -> None:
+            self._want_connected = False
+            if self.ib.isConnected():
+                self.ib.disconnect()
+            self._stopping = True
+
+        self._call(_shutdown)
+        self._thread.join(timeout=REQUEST_TIMEOUT)
+
+    # ---------------- Helpers (broker thread içinde) ----------------
 
     def _refresh_target(self) -> None:
         target = get_ib_target()
         self.host = target.get("host", "127.0.0.1")
         self.port = int(target.get("port", 7496))
 
-    def _base_status(self) -> Dict[str, Any]:
+    def _base_status(self, connected: bool | None = None) -> Dict[str, Any]:
+        """connected verilmezse IB()'ye sorulur — sadece broker thread'inde."""
         return {
             "service": "ibkr",
             "host": self.host,
             "port": self.port,
             "client_id": self.client_id,
-            "connected": self.ib.isConnected(),
+            "connected": self.ib.isConnected() if connected is None else connected,
         }
 
-    # ---------------- Public Methods ----------------
+    def _timeout_status(self) -> Dict[str, Any]:
+        return {
+            "service": "ibkr",
+            "host": self.host,
+            "port": self.port,
+            "client_id": self.client_id,
+            "connected": False,
+            "error": "IBKR broker thread zaman aşımı (%.1fs)" % REQUEST_TIMEOUT,
+        }
 
-    def connect(self) -> Dict[str, Any]:
-        """
-        IBKR'a bağlanmayı dener. Hata olursa error alanına yazar.
-        Bu metod her çağrıldığında içinde bulunduğu thread'e
-        event loop atıyoruz.
-        """
-        ensure_event_loop()
+    def _connect(self) -> Dict[str, Any]:
+        self._want_connected = True
         self._refresh_target()
         status = self._base_status()
 
         if self.ib.isConnected():
+            self.store.set_connected(True)
+            return status
+
+        # Art arda gelen isteklerin her biri yeniden bağlanmaya çalışmasın
+        if time.monotonic() - self._last_connect_attempt < RECONNECT_INTERVAL:
+            if self._last_connect_error:
+                status["error"] = self._last_connect_error
             return status
 
+        self._last_connect_attempt = time.monotonic()
         try:
-            self.ib.connect(self.host, self.port, clientId=self.client_id)
+            self.ib.connect(
+                self.host, self.port, clientId=self.client_id, timeout=CONNECT_TIMEOUT
+            )
             status["connected"] = self.ib.isConnected()
+            self._last_connect_error = None
+            # connect() hesap/pozisyonları senkronlar; hafızayı buradan tohumla
+            self.store.reset(self.ib.accountValues(), self.ib.positions())
+            # Kopma ile düşen fiyat aboneliklerini yenile (contract'lar geçerli)
+            for symbol in list(self.market.streaming):
+                self._subscribe(symbol)
         except Exception as e:
             status["connected"] = False
             status["error"] = str(e)
+            self._last_connect_error = str(e)
 
         return status
 
+    def _qualify(self, symbol: str) -> Any:
+        contract = self.market.contracts.get(symbol)
+        if contract is None:
+            qualified = self.ib.qualifyContracts(Stock(symbol, "SMART", "USD"))
+            if not qualified:
+                raise RuntimeError(f"Contract bulunamadı: {symbol}")
+            contract = qualified[0]
+            self.market.add_contract(symbol, contract)
+        return contract
+
+    def _subscribe(self, symbol: str) -> None:
+        contract = self.market.contracts[symbol]
+        self.market.streaming[symbol] = self.ib.reqMktData(contract, "", False, False)
+
+    def _fetch_price(self, symbol: str, max_age: float) -> float | None:
+        # Kuyrukta beklerken streaming güncellemiş olabilir
+        price = self.market.price(symbol, max_age)
+        if price is not None:
+            return price
+        if not self._connect().get("connected"):
+            return None
+        contract = self._qualify(symbol)
+        for ticker in self.ib.reqTickers(contract):
+            self.market.set_price(symbol, ticker.marketPrice())
+        if STREAM_PRICES and symbol not in self.market.streaming:
+            self._subscribe(symbol)
+        return self.market.price(symbol, max_age)
+
+    def _connected_snapshot(self) -> Tuple[AccountSnapshot, Dict[str, Any] | None]:
+        """
+        Güncel snapshot; bağlı değilse broker thread'inde bağlanmayı dener
+        ve (yeni snapshot, connect status'u) döner.
+        """
+        snap = self.store.snapshot
+        if snap.connected:
+            return snap, None
+        status = self.connect()
+        return self.store.snapshot, status
+
+    # ---------------- Public Methods ----------------
+
+    def connect(self) -> Dict[str, Any]:
+        """
+        IBKR'a bağlanmayı dener. Hata olursa error alanına yazar.
+        Bağlantı broker thread'inde kurulur; bir kez bağlandıktan sonra
+        kopma durumunda broker thread kendisi yeniden bağlanır.
+        """
+        try:
+            return self._call(self._connect)
+        except concurrent.futures.TimeoutError:
+            return self._timeout_status()
+
     def get_status(self) -> Dict[str, Any]:
         """
         Hesap özetini döner.
+        Bağlıyken broker'a gitmez; tek bir AccountSnapshot'ı okur (O(1)).
         """
-        ensure_event_loop()
-        self._refresh_target()
-        status = self._base_status()
+        snap, status = self._connected_snapshot()
+        if status is None or snap.connected:
+            status = self._base_status(connected=snap.connected)
         status["mode"] = get_admin_mode()
 
-        if not self.ib.isConnected():
-            status = self.connect()
-            if not status.get("connected"):
-                status.setdefault(
-                    "note",
-                    "Bağlantı sağlanamadı. IBKR TWS/Gateway açık mı?",
-                )
-                return status
-
-        try:
-            values = self.ib.accountValues()
-            data: Dict[str, str] = {}
-            for v in values:
-                data[v.tag] = v.value
-
-            def _to_float(val: str | None) -> float:
-                try:
-                    return float(val) if val else 0.0
-                except ValueError:
-                    return 0.0
-
-            status.update(
-                {
-                    "account_id": data.get("Account", "N/A"),
-                    "equity": _to_float(data.get("NetLiquidation")),
-                    "cash": _to_float(data.get("AvailableFunds")),
-                    "buying_power": _to_float(data.get("BuyingPower")),
-                    "currency": data.get("Currency", "USD"),
-                }
+        if not snap.connected:
+            status["connected"] = False
+            status.setdefault(
+                "note",
+                "Bağlantı sağlanamadı. IBKR TWS/Gateway açık mı?",
             )
-        except Exception as e:
-            status["error"] = str(e)
+            return status
 
+        status.update(snap.account)
+        status["version"] = snap.version
+        status["updated_at"] = snap.updated_at
         return status
 
     def positions(self) -> List[Dict[str, Any]]:
         """
-        Açık pozisyonları döner.
+        Açık pozisyonları döner (AccountStore snapshot'ı).
         """
-        ensure_event_loop()
-        self._refresh_target()
+        snap, _ = self._connected_snapshot()
+        return list(snap.positions) if snap.connected else []
 
-        if not self.ib.isConnected():
-            s = self.connect()
-            if not s.get("connected"):
-                return []
+    def positions_snapshot(self) -> Dict[str, Any]:
+        """
+        Pozisyonlar + snapshot versiyonu / son güncellenme zamanı
+        (hepsi aynı snapshot'tan).
+        """
+        snap, _ = self._connected_snapshot()
+        return {
+            "positions": list(snap.positions) if snap.connected else [],
+            "connected": snap.connected,
+            "version": snap.version,
+            "updated_at": snap.updated_at,
+        }
+
+    def qualify_contract(self, symbol: str) -> Any:
+        """Sembolün qualified contract'ı (ilk seferden sonra cache'ten)."""
+        symbol = symbol.upper()
+        contract = self.market.contracts.get(symbol)
+        if contract is not None:
+            return contract
+        return self._call(self._qualify, symbol)
 
+    def get_price(self, symbol: str, max_age: float | None = None) -> float | None:
+        """
+        Sembolün son fiyatı.
+        max_age (sn) içinde güncellenmiş fiyat varsa broker'a gitmeden döner;
+        yoksa broker thread'inde snapshot alınır ve sembole streaming abone olunur.
+        """
+        symbol = symbol.upper()
+        if max_age is None:
+            max_age = PRICE_MAX_AGE
+        price = self.market.price(symbol, max_age)
+        if price is not None:
+            return price
         try:
-            raw_positions = self.ib.positions()
-        except Exception:
-            return []
-
-        result: List[Dict[str, Any]] = []
-        for p in raw_positions:
-            result.append(
-                {
-                    "symbol": p.contract.symbol,
-                    "secType": p.contract.secType,
-                    "position": float(p.position),
-                    "avg_cost": float(p.avgCost),
-                }
-            )
-        return result
+            return self._call(self._fetch_price, symbol, max_age)
+        except concurrent.futures.TimeoutError:
+            return None
+
+    def price_age(self, symbol: str) -> float | None:
+        """Cache'teki fiyatın yaşı (sn); hiç fiyat yoksa None."""
+        return self.market.age(symbol.upper())
 
 
 # Global tek instance
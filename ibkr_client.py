@@ -4,15 +4,282 @@ IBKRClient:
 - LOCAL modda: PC üzerindeki boru-api-local servisine gider (SSH reverse tünel ile 6001).
 - VPS modda : İleride VPS üzerindeki IBKR servisine gidecek (şimdilik placeholder).
 Bu sınıf IBKR verisini HTTP üzerinden çeker, IBKR'a direkt bağlanmaz.
+
+Tünel üzerinden her istekte yeni TCP bağlantısı açmamak için
+keep-alive bağlantı havuzlu tek bir requests.Session kullanılır.
 """
 
+import threading
+import time
+
 import requests
-from admin_mode import get_admin_mode
+from requests.adapters import HTTPAdapter
 
+from admin_mode import add_mode_listener, get_admin_mode
+from metrics import metrics
+
+
+# ----------------------------------------
+# HTTP havuz / timeout ayarları
+# ----------------------------------------
+POOL_SIZE = 10                 # host başına açık tutulacak max bağlantı
+DEFAULT_TIMEOUT = (1.5, 5.0)   # (connect, read) saniye
+
+# Path bazlı timeout'lar: (connect, read)
+ENDPOINT_TIMEOUTS = {
+    "/api/ibkr/status": (1.5, 3.0),
+    "/api/ibkr/positions": (1.5, 5.0),
+    "/api/ibkr/place_order": (1.5, 15.0),
+}
+
+# Cache ayarları: anahtar → (ttl, stale_ttl) saniye
+#   ttl       : bu süre içinde cevap taze sayılır, upstream'e gidilmez
+#   stale_ttl : bu süreye kadar eski cevap hemen döner, arka planda yenilenir
+CACHE_TTLS = {
+    "/api/ibkr/status": (2.0, 60.0),
+    "/api/ibkr/positions": (2.0, 60.0),
+    "account": (5.0, 300.0),
+}
+DEFAULT_CACHE_TTL = (2.0, 60.0)
+
+
+class ReadCache:
+    """
+    TTL + stale-while-revalidate cache.
+    - Taze kayıt      → direkt döner (cached=True, stale=False)
+    - Bayat kayıt     → direkt döner (stale=True), arka planda yenilenir
+    - Kayıt yok/çok eski → senkron yükler
+    Yenileme hata verirse eski (başarılı) kayıt korunur: serve-stale-on-error.
+
+    Her başarılı kaydın bir "version"ı vardır; sadece içerik (ok / data /
+    mode) değişince artar. ETag'ler bundan üretilir, cevap serialize edilmez.
+    """
 
-class IBKRClient:
     def __init__(self):
-        pass
+        self._lock = threading.Lock()
+        self._entries = {}      # key → {"result", "ts", "error", "version"}
+        self._refreshing = set()
+        self._version = 0       # süreç boyunca artan sayaç (clear() sıfırlamaz)
+
+    def get(self, key, loader, ttl: float, stale_ttl: float):
+        now = time.monotonic()
+        entry = self._entries.get(key)
+
+        if entry is not None:
+            age = now - entry["ts"]
+            if age < ttl:
+                return self._wrap(entry, age, stale=False)
+            if age < stale_ttl:
+                self._refresh_async(key, loader, stale_ttl)
+                return self._wrap(entry, age, stale=True)
+
+        result, version = self._load(key, loader, stale_ttl)
+        return dict(result, cached=False, age_ms=0, stale=False, version=version)
+
+    def peek(self, key):
+        """Yükleme tetiklemeden cache kaydını döner (yoksa None)."""
+        return self._entries.get(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    @staticmethod
+    def _wrap(entry, age: float, stale: bool):
+        result = dict(
+            entry["result"], cached=True, age_ms=int(age * 1000), stale=stale,
+            version=entry["version"],
+        )
+        if stale and entry.get("error"):
+            result["refresh_error"] = entry["error"]
+        return result
+
+    @staticmethod
+    def _same_content(a: dict, b: dict) -> bool:
+        return all(a.get(k) == b.get(k) for k in ("ok", "mode", "data"))
+
+    def _load(self, key, loader, stale_ttl: float):
+        """Yükler ve saklar; (result, version) döner (hata cevabında version None)."""
+        result = loader()
+        now = time.monotonic()
+        with self._lock:
+            prev = self._entries.get(key)
+            if (
+                not result.get("ok")
+                and prev is not None
+                and prev["result"].get("ok")
+                and now - prev["ts"] < stale_ttl
+            ):
+                # Son başarılı cevabı koru, sadece hatayı not düş
+                prev["error"] = result.get("error")
+                return result, None
+            if not result.get("ok"):
+                version = None
+            elif (
+                prev is not None
+                and prev["version"] is not None
+                and self._same_content(prev["result"], result)
+            ):
+                version = prev["version"]
+            else:
+                self._version += 1
+                version = self._version
+            self._entries[key] = {"result": result, "ts": now, "error": None, "version": version}
+        return result, version
+
+    def _refresh_async(self, key, loader, stale_ttl: float) -> None:
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def _run():
+            try:
+                self._load(key, loader, stale_ttl)
+            except Exception as e:
+                print("ReadCache refresh error:", key, e)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=_run, name="ibkr-cache-refresh", daemon=True).start()
+
+
+class SingleFlight:
+    """
+    Aynı anahtar için eşzamanlı çağrıları tek bir çağrıda birleştirir.
+    İlk gelen (leader) fonksiyonu çalıştırır, diğerleri onun sonucunu bekler.
+    """
+
+    class _Call:
+        __slots__ = ("done", "result", "error")
+
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """fn() sonucunu döner; (sonuç, paylaşıldı_mı) tuple'ı olarak."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+
+class IBKRClient:
+    def __init__(self, pool_size: int = POOL_SIZE, timeouts: dict | None = None):
+        self.pool_size = pool_size
+        self.timeouts = dict(ENDPOINT_TIMEOUTS)
+        if timeouts:
+            self.timeouts.update(timeouts)
+
+        self._stats_lock = threading.Lock()
+        self._stats = {"requests": 0, "errors": 0, "coalesced": 0, "mode_switches": 0}
+        self._retired = {"connections_opened": 0, "requests": 0}
+        self._flight = SingleFlight()
+        self.cache = ReadCache()
+        self.session = self._new_session()
+
+        add_mode_listener(self._on_mode_change)
+
+    def _on_mode_change(self, old_mode: str, new_mode: str) -> None:
+        """
+        LOCAL ↔ VPS geçişi: yeni Session'a atomik geçiş yapar,
+        eski havuzdaki (eski tünele ait) bağlantıları kapatır ve cache'i boşaltır.
+        """
+        with self._stats_lock:
+            old_session = self.session
+            self.session = self._new_session()
+            self._stats["mode_switches"] += 1
+            for pool in self._iter_pools(old_session):
+                self._retired["connections_opened"] += pool.num_connections
+                self._retired["requests"] += pool.num_requests
+        self.cache.clear()
+        old_session.close()
+        print(f"IBKRClient mode change: {old_mode} -> {new_mode}, base={self._base_url_for(new_mode)}")
+
+    def _new_session(self) -> requests.Session:
+        """Keep-alive bağlantı havuzlu yeni bir Session kurar."""
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=2,          # 6001 (LOCAL) + 6002 (VPS)
+            pool_maxsize=self.pool_size,
+            max_retries=0,
+        )
+        session.mount("http://", adapter)
+        session.headers["Connection"] = "keep-alive"
+        return session
+
+    def _count(self, key: str) -> None:
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    @staticmethod
+    def _observe(path: str, started: float, outcome: str) -> None:
+        labels = {"target": "ibkr_client", "path": path}
+        metrics.observe("upstream_request_duration_seconds", time.perf_counter() - started, labels)
+        labels["outcome"] = outcome
+        metrics.inc("upstream_requests_total", labels)
+
+    @staticmethod
+    def _iter_pools(session: requests.Session):
+        pools = session.get_adapter("http://").poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                yield pool
+
+    def pool_stats(self) -> dict:
+        """
+        Bağlantı havuzu istatistikleri (/api/health için).
+        reused = havuzdan tekrar kullanılan bağlantıyla yapılan istek sayısı.
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+            opened = self._retired["connections_opened"]
+            served = self._retired["requests"]
+
+        hosts = {}
+        for pool in self._iter_pools(self.session):
+            opened += pool.num_connections
+            served += pool.num_requests
+            hosts[f"{pool.host}:{pool.port}"] = {
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+            }
+
+        stats.update({
+            "pool_size": self.pool_size,
+            "connections_opened": opened,
+            "reused": max(served - opened, 0),
+            "reuse_ratio": round((served - opened) / served, 3) if served else 0.0,
+            "hosts": hosts,
+        })
+        return stats
 
     def get_base_url(self) -> str:
         """
@@ -25,7 +292,10 @@ class IBKRClient:
         VPS:
             İleride VPS IBKR servisini buraya bağlayacağız (ör: 6002).
         """
-        mode = get_admin_mode()
+        return self._base_url_for(get_admin_mode())
+
+    @staticmethod
+    def _base_url_for(mode: str) -> str:
         if mode == "LOCAL":
             return "http://127.0.0.1:6001"
         elif mode == "VPS":
@@ -34,14 +304,19 @@ class IBKRClient:
         else:
             return "http://127.0.0.1:6001"
 
-    def _request_json(self, path: str, timeout: float = 5.0):
+    def _request_json(self, path: str, timeout=None, mode: str | None = None):
         """Verilen path için JSON isteği yapar ve sonuç + meta döner."""
-        base = self.get_base_url()
-        url = base + path
-        mode = get_admin_mode()
+        if mode is None:
+            mode = get_admin_mode()
+        url = self._base_url_for(mode) + path
+        if timeout is None:
+            timeout = self.timeouts.get(path, DEFAULT_TIMEOUT)
+        self._count("requests")
+        started = time.perf_counter()
         try:
-            resp = requests.get(url, timeout=timeout)
+            resp = self.session.get(url, timeout=timeout)
             resp.raise_for_status()
+            self._observe(path, started, "ok")
             return {
                 "ok": True,
                 "mode": mode,
@@ -50,6 +325,8 @@ class IBKRClient:
                 "error": None,
             }
         except Exception as e:
+            self._count("errors")
+            self._observe(path, started, "error")
             return {
                 "ok": False,
                 "mode": mode,
@@ -58,10 +335,70 @@ class IBKRClient:
                 "error": str(e),
             }
 
+    def place_order(self, order_payload: dict):
+        """
+        Uzak /api/ibkr/place_order endpoint'ine emir POST eder.
+        Emirler cache'lenmez ve birleştirilmez (single-flight yok).
+        """
+        path = "/api/ibkr/place_order"
+        mode = get_admin_mode()
+        url = self._base_url_for(mode) + path
+        self._count("requests")
+        started = time.perf_counter()
+        try:
+            resp = self.session.post(
+                url, json=order_payload, timeout=self.timeouts.get(path, DEFAULT_TIMEOUT)
+            )
+            resp.raise_for_status()
+            self._observe(path, started, "ok")
+            return {"ok": True, "mode": mode, "url": url, "data": resp.json(), "error": None}
+        except Exception as e:
+            self._count("errors")
+            self._observe(path, started, "error")
+            return {"ok": False, "mode": mode, "url": url, "data": None, "error": str(e)}
+
+    def _read(self, path: str):
+        """
+        Okuma isteği (single-flight): aynı path + mod için uçuşta olan
+        bir istek varsa yenisini açmaz, onun sonucunu paylaşır.
+        """
+        mode = get_admin_mode()
+        result, shared = self._flight.do(
+            (mode, path), lambda: self._request_json(path, mode=mode)
+        )
+        if shared:
+            self._count("coalesced")
+        return result
+
+    def cached(self, name: str, loader):
+        """
+        loader() sonucunu CACHE_TTLS[name] ayarlarıyla cache'ler.
+        Dönen dict'e cached / age_ms / stale / version alanları eklenir.
+        """
+        ttl, stale_ttl = CACHE_TTLS.get(name, DEFAULT_CACHE_TTL)
+        return self.cache.get((get_admin_mode(), name), loader, ttl, stale_ttl)
+
+    def connection_state(self) -> int:
+        """
+        Cache'teki son status'a göre IBKR bağlantısı (upstream'e gitmez):
+        1 bağlı, 0 bağlı değil / hata, -1 henüz bilinmiyor.
+        """
+        entry = self.cache.peek((get_admin_mode(), "/api/ibkr/status"))
+        if entry is None:
+            return -1
+        result = entry["result"] or {}
+        data = result.get("data") or {}
+        # Son yenileme hata verdiyse eski başarılı cevaba güvenme
+        if entry.get("error") or not result.get("ok"):
+            return 0
+        return 1 if data.get("connected") else 0
+
     def get_status(self):
-        """Uzak /api/ibkr/status endpoint'ini çağırır."""
-        return self._request_json("/api/ibkr/status")
+        """Uzak /api/ibkr/status endpoint'ini çağırır (cache'li)."""
+        path = "/api/ibkr/status"
+        return self.cached(path, lambda: self._read(path))
 
     def get_positions(self):
-        """Uzak /api/ibkr/positions endpoint'ini çağırır."""
-        return self._request_json("/api/ibkr/positions")
+        """Uzak /api/ibkr/positions endpoint'ini çağırır (cache'li)."""
+        path = "/api/ibkr/positions"
+        return self.cached(path, lambda: self._read(path))
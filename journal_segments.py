@@ -0,0 +1,395 @@
+"""
+journal_segments.py
+manual_orders.log için segment (rotasyon) yönetimi.
+
+Aktif segment her zaman manual_orders.log'dur. Boyut / yaş sınırı aşılınca
+order_segments/ klasörüne sıra numarasıyla taşınır ve "mühürlenir":
+
+    order_segments/manual_orders.000001.log.gz     (gzip, kapalı segment)
+    order_segments/manual_orders.000001.meta.json  (header)
+
+Header: first_ts / last_ts / count / bytes + sembol bloom filtresi.
+Geçmiş sorguları ve replay araçları header'a bakıp segmenti hiç açmadan
+atlayabilir. Henüz mühürlenmemiş (.log) segmentler de okunabilir.
+
+.gz dosyası tek parça değil, ~SEAL_BLOCK_BYTES'lık (tam satırlardan oluşan)
+ardışık gzip member'larından oluşur (normal gzip araçları yine tek dosya
+gibi açar). Header'daki "blocks" index'i [sıkıştırılmamış_offset,
+sıkıştırılmış_offset] çiftleridir: geçmiş sayfası için segmentin tamamı
+değil, sadece ilgili blok(lar) açılır. Açılan bloklar toplam boyutu
+BLOCK_CACHE_BYTES ile sınırlı bir LRU'da tutulur.
+"""
+import glob
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # Windows (PC tarafı)
+    fcntl = None
+
+SEGMENT_DIR_NAME = "order_segments"
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024     # aktif segment bu boyutu geçince rotate
+SEGMENT_MAX_AGE = 24 * 3600              # ya da ilk kaydından bu kadar süre geçince
+
+SEAL_BLOCK_BYTES = 256 * 1024            # gzip member başına sıkıştırılmamış boyut
+BLOCK_CACHE_BYTES = 8 * 1024 * 1024      # süreç başına açılmış blok cache'i üst sınırı
+
+BLOOM_BITS = 4096
+BLOOM_HASHES = 4
+
+_seal_lock = threading.Lock()
+
+
+class SymbolBloom:
+    """Segmentte geçen semboller için küçük bloom filtresi."""
+
+    def __init__(self, bits: int = BLOOM_BITS, hashes: int = BLOOM_HASHES, data: bytes | None = None):
+        self.size = bits
+        self.hashes = hashes
+        self.bits = bytearray(data) if data is not None else bytearray(bits // 8)
+
+    def _positions(self, symbol: str):
+        digest = hashlib.blake2b(symbol.upper().encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, symbol: str) -> None:
+        for pos in self._positions(symbol):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def might_contain(self, symbol: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(symbol))
+
+    def to_hex(self) -> str:
+        return self.bits.hex()
+
+    @classmethod
+    def from_header(cls, header: dict) -> "SymbolBloom":
+        return cls(
+            bits=header.get("bloom_bits", BLOOM_BITS),
+            hashes=header.get("bloom_hashes", BLOOM_HASHES),
+            data=bytes.fromhex(header["symbols_bloom"]),
+        )
+
+
+# ----------------------------------------------------------------------
+# Dosya adları
+# ----------------------------------------------------------------------
+
+def segment_dir(active_path: str) -> str:
+    return os.path.join(os.path.dirname(active_path), SEGMENT_DIR_NAME)
+
+
+def _base_name(active_path: str) -> str:
+    name = os.path.basename(active_path)
+    return name[:-4] if name.endswith(".log") else name
+
+
+def _segment_path(active_path: str, seq: int, suffix: str) -> str:
+    return os.path.join(segment_dir(active_path), f"{_base_name(active_path)}.{seq:06d}{suffix}")
+
+
+def list_segments(active_path: str) -> list:
+    """
+    Kapalı segmentleri yeniden eskiye listeler.
+    Her eleman: {"seq", "path", "compressed", "header" (yoksa None)}
+    """
+    pattern = re.compile(re.escape(_base_name(active_path)) + r"\.(\d{6})\.log(\.gz)?$")
+    found = {}
+    for path in glob.glob(os.path.join(segment_dir(active_path), "*.log*")):
+        m = pattern.match(os.path.basename(path))
+        if not m:
+            continue
+        seq = int(m.group(1))
+        compressed = bool(m.group(2))
+        # Mühürleme sırasında ikisi birden varsa sıkıştırılmışı tercih et
+        if seq in found and not compressed:
+            continue
+        found[seq] = {"seq": seq, "path": path, "compressed": compressed, "header": None}
+
+    for seq, seg in found.items():
+        if seg["compressed"]:
+            seg["header"] = read_header(active_path, seq)
+    return [found[seq] for seq in sorted(found, reverse=True)]
+
+
+def next_seq(active_path: str) -> int:
+    """Aktif segment rotate edilince alacağı sıra numarası."""
+    segments = list_segments(active_path)
+    return segments[0]["seq"] + 1 if segments else 1
+
+
+def read_header(active_path: str, seq: int) -> dict | None:
+    try:
+        with open(_segment_path(active_path, seq, ".meta.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+# ----------------------------------------------------------------------
+# Rotasyon + mühürleme
+# ----------------------------------------------------------------------
+
+def rotate(active_path: str) -> str:
+    """
+    Aktif segmenti order_segments/ altına sıradaki numarayla taşır.
+    Çağıran taraf aktif dosya üzerinde flock tutmalıdır.
+    Taşınan (henüz sıkıştırılmamış) dosyanın yolunu döner.
+    """
+    os.makedirs(segment_dir(active_path), exist_ok=True)
+    raw_path = _segment_path(active_path, next_seq(active_path), ".log")
+    os.replace(active_path, raw_path)
+    return raw_path
+
+
+def _write_blocks(lines, gz_tmp_path: str) -> dict:
+    """
+    Satırları SEAL_BLOCK_BYTES'lık gzip member'ları olarak yazar;
+    header alanlarını (ts aralığı, count, bytes, bloom, blocks) döner.
+    """
+    bloom = SymbolBloom()
+    first_ts = None
+    last_ts = None
+    count = 0
+    blocks = []
+    raw_offset = 0
+    buf = []
+    buf_size = 0
+
+    with open(gz_tmp_path, "wb") as dst:
+        def flush():
+            nonlocal raw_offset, buf, buf_size
+            if not buf:
+                return
+            blocks.append([raw_offset, dst.tell()])
+            dst.write(gzip.compress(b"".join(buf), compresslevel=6, mtime=0))
+            raw_offset += buf_size
+            buf = []
+            buf_size = 0
+
+        for raw in lines:
+            buf.append(raw)
+            buf_size += len(raw)
+            if buf_size >= SEAL_BLOCK_BYTES:
+                flush()
+            if not raw.strip():
+                continue
+            try:
+                obj = json.loads(raw)
+            except Exception:
+                continue
+            count += 1
+            ts = obj.get("ts")
+            if ts:
+                first_ts = ts if first_ts is None or ts < first_ts else first_ts
+                last_ts = ts if last_ts is None or ts > last_ts else last_ts
+            if obj.get("symbol"):
+                bloom.add(str(obj["symbol"]))
+        flush()
+
+    return {
+        "first_ts": first_ts,
+        "last_ts": last_ts,
+        "count": count,
+        "bytes": raw_offset,
+        "compressed": "gzip",
+        "bloom_bits": bloom.size,
+        "bloom_hashes": bloom.hashes,
+        "symbols_bloom": bloom.to_hex(),
+        "blocks": blocks,
+    }
+
+
+def _write_header(active_path: str, seq: int, header: dict) -> None:
+    meta_path = _segment_path(active_path, seq, ".meta.json")
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(header, f)
+    os.replace(meta_path + ".tmp", meta_path)
+
+
+def seal_segment(active_path: str, raw_path: str) -> dict:
+    """
+    Ham segmenti tarar, header'ını çıkarır, bloklar halinde gzip'ler ve
+    ham dosyayı siler.
+    """
+    seq = int(os.path.basename(raw_path).split(".")[-2])
+    tmp_path = _segment_path(active_path, seq, ".log.gz") + ".tmp"
+    with open(raw_path, "rb") as src:
+        header = {"seq": seq, **_write_blocks(src, tmp_path)}
+    # Önce header, sonra .gz: .gz görünen her segmentin header'ı hazırdır
+    _write_header(active_path, seq, header)
+    os.replace(tmp_path, _segment_path(active_path, seq, ".log.gz"))
+    os.remove(raw_path)
+    return header
+
+
+def reindex_segment(active_path: str, seg: dict) -> dict:
+    """
+    Blok index'i olmayan (eski tip, tek member) .gz segmenti akış halinde
+    açıp bloklu olarak yeniden yazar. Bellekte sadece bir blok tutulur.
+    """
+    seq = seg["seq"]
+    tmp_path = seg["path"] + ".tmp"
+    with gzip.open(seg["path"], "rb") as src:
+        header = {"seq": seq, **_write_blocks(src, tmp_path)}
+    # Burada sıra ters: blocks'suz eski header yeni dosyayı da okuyabilir,
+    # blocks'lu yeni header eski tek member'lı dosyayı okuyamaz
+    os.replace(tmp_path, seg["path"])
+    _write_header(active_path, seq, header)
+    return header
+
+
+def seal_pending(active_path: str) -> None:
+    """
+    Mühürlenmemiş ham segmentleri (yeni rotate edilmiş ya da çökme sonrası
+    yarım kalmış) mühürler. Süreçler arası çakışmayı önlemek için kilitli.
+    """
+    if not os.path.isdir(segment_dir(active_path)):
+        return
+    with _seal_lock, open(os.path.join(segment_dir(active_path), ".seal.lock"), "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        for seg in list_segments(active_path):
+            try:
+                if not seg["compressed"]:
+                    seal_segment(active_path, seg["path"])
+                elif seg["header"] is not None and "blocks" not in seg["header"]:
+                    reindex_segment(active_path, seg)
+            except Exception as e:
+                print("journal_segments seal error:", seg["path"], e)
+
+
+def seal_async(active_path: str) -> None:
+    threading.Thread(
+        target=seal_pending, args=(active_path,), name="journal-seal", daemon=True
+    ).start()
+
+
+# ----------------------------------------------------------------------
+# Okuma
+# ----------------------------------------------------------------------
+
+class _BlockCache:
+    """Açılmış blokların LRU cache'i; sınır girdi sayısı değil toplam byte."""
+
+    def __init__(self, max_bytes: int = BLOCK_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+            return data
+
+    def put(self, key, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._items[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted)
+
+
+_block_cache = _BlockCache()
+
+
+def iter_bytes_reverse(data: bytes, end: int | None = None):
+    """Bellekteki satırları sondan başa: (satır_başlangıç_offset'i, satır_bytes)."""
+    end = len(data) if end is None else max(0, min(end, len(data)))
+    while end > 0:
+        start = data.rfind(b"\n", 0, end) + 1
+        line = data[start:end]
+        if line.strip():
+            yield start, line
+        end = start - 1
+
+
+def _read_block(path: str, stat: os.stat_result, blocks: list, i: int) -> bytes:
+    key = (path, stat.st_mtime_ns, i)
+    data = _block_cache.get(key)
+    if data is None:
+        c_start = blocks[i][1]
+        c_end = blocks[i + 1][1] if i + 1 < len(blocks) else stat.st_size
+        with open(path, "rb") as f:
+            f.seek(c_start)
+            data = gzip.decompress(f.read(c_end - c_start))
+        _block_cache.put(key, data)
+    return data
+
+
+def iter_segment_reverse(seg: dict, end: int | None = None):
+    """
+    Mühürlü (.gz) segmentin satırlarını sondan başa dolaşır:
+    (sıkıştırılmamış offset, satır_bytes). end verilirse o offset'ten öncesi.
+    Sadece gereken bloklar açılır.
+    """
+    path = seg["path"]
+    header = seg.get("header") or {}
+    blocks = header.get("blocks")
+    if not blocks:
+        # Eski tip segment (seal_pending bloklu hale getirene kadar): tek seferlik
+        # tam açma, cache'lenmez
+        with gzip.open(path, "rb") as f:
+            yield from iter_bytes_reverse(f.read(), end)
+        return
+
+    stat = os.stat(path)
+    total = header.get("bytes", 0)
+    end = total if end is None else max(0, min(end, total))
+    starts = [b[0] for b in blocks]
+    i = bisect_right(starts, end - 1) - 1
+    while i >= 0 and end > 0:
+        block_start = blocks[i][0]
+        data = _read_block(path, stat, blocks, i)
+        for offset, line in iter_bytes_reverse(data, end - block_start):
+            yield block_start + offset, line
+        end = block_start
+        i -= 1
+
+
+def iter_records(active_path: str):
+    """
+    Replay için: tüm journal'ı eskiden yeniye (kapalı segmentler + aktif) dolaşır.
+    """
+    for seg in reversed(list_segments(active_path)):
+        opener = gzip.open if seg["compressed"] else open
+        try:
+            with opener(seg["path"], "rb") as f:
+                yield from _parse_lines(f)
+        except FileNotFoundError:
+            # Tam bu sırada mühürlenmiş olabilir
+            with gzip.open(seg["path"] + ".gz", "rb") as f:
+                yield from _parse_lines(f)
+
+    if os.path.exists(active_path):
+        with open(active_path, "rb") as f:
+            yield from _parse_lines(f)
+
+
+def _parse_lines(f):
+    for raw in f:
+        if not raw.strip():
+            continue
+        try:
+            yield json.loads(raw)
+        except Exception:
+            continue
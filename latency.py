@@ -0,0 +1,162 @@
+"""
+latency.py
+Emir hattı gecikme ölçümü (HDR tarzı histogramlar).
+
+Master event'ler sinyalin alındığı andaki monotonic zamanı ("t_mono")
+taşır; hattın her aşamasında bu başlangıca göre geçen süre kaydedilir:
+
+    master_queue   sinyal → master emrin işlenmeye başlaması (lane bekleme)
+    master_ack     sinyal → master broker'ın emri kabul etmesi
+    master_fill    sinyal → master emrin dolması (execDetails)
+    copy_ack       sinyal → follower emrinin broker'a kabul ettirilmesi
+    copy_fill      sinyal → follower emrinin dolması
+    lane_wait      emrin dispatch lane kuyruğunda beklemesi (order_dispatch)
+    lane_exec      lane'de broker çağrısının süresi
+
+Her aşama toplamda ve broker / portfolio gibi boyutlara göre ayrı
+histogramlarda tutulur; /api/latency p50 / p90 / p99 / max döner.
+
+Histogram log-lineer kovalar kullanır (2'nin her kuvveti SUB_BUCKETS
+parçaya bölünür): hafıza sabit, göreli hata ~%6, kayıt O(1).
+"""
+import threading
+import time
+from collections import OrderedDict
+
+SUB_BITS = 4                 # 2^4 = 16 alt kova → ~%6 göreli hata
+SUB_BUCKETS = 1 << SUB_BITS
+PERCENTILES = (50, 90, 99)
+FILL_TRACK_MAX = 10000       # dolmasını beklediğimiz max emir
+
+
+def _bucket_index(value: int) -> int:
+    if value < SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BITS - 1
+    return (shift + 1) * SUB_BUCKETS + ((value >> shift) - SUB_BUCKETS)
+
+
+def _bucket_high(index: int) -> int:
+    """Kovanın temsil ettiği en yüksek değer (HDR: highest equivalent value)."""
+    if index < SUB_BUCKETS:
+        return index
+    shift = index // SUB_BUCKETS - 1
+    top = index % SUB_BUCKETS + SUB_BUCKETS
+    return ((top + 1) << shift) - 1
+
+
+class Histogram:
+    """Mikrosaniye çözünürlüklü gecikme histogramı (değerler ms olarak raporlanır)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {}
+        self.count = 0
+        self.total_us = 0
+        self.max_us = 0
+
+    def record(self, ms: float) -> None:
+        us = max(0, int(ms * 1000))
+        idx = _bucket_index(us)
+        with self._lock:
+            self.counts[idx] = self.counts.get(idx, 0) + 1
+            self.count += 1
+            self.total_us += us
+            if us > self.max_us:
+                self.max_us = us
+
+    def summary(self) -> dict:
+        with self._lock:
+            counts = sorted(self.counts.items())
+            count, total_us, max_us = self.count, self.total_us, self.max_us
+
+        result = {"count": count}
+        targets = [(p, p / 100.0 * count) for p in PERCENTILES]
+        seen = 0
+        for idx, n in counts:
+            seen += n
+            while targets and seen >= targets[0][1]:
+                p, _ = targets.pop(0)
+                result[f"p{p}"] = round(min(_bucket_high(idx), max_us) / 1000.0, 3)
+        for p, _ in targets:
+            result[f"p{p}"] = None
+        result["max"] = round(max_us / 1000.0, 3) if count else None
+        result["mean"] = round(total_us / count / 1000.0, 3) if count else None
+        return result
+
+
+class LatencyRecorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hists = {}
+        self._pending_fills = OrderedDict()
+        self.started_at = time.time()
+
+    def _hist(self, key) -> Histogram:
+        hist = self._hists.get(key)
+        if hist is None:
+            with self._lock:
+                hist = self._hists.setdefault(key, Histogram())
+        return hist
+
+    def observe(self, stage: str, ms: float, **dims) -> None:
+        """stage için toplam + her boyut (broker=..., portfolio=...) histogramına yazar."""
+        self._hist((stage, None, None)).record(ms)
+        for dim, value in dims.items():
+            if value:
+                self._hist((stage, dim, str(value))).record(ms)
+
+    def since(self, stage: str, t_mono: float | None, **dims) -> None:
+        """t_mono (time.monotonic) başlangıcından şimdiye geçen süreyi kaydeder."""
+        if t_mono is None:
+            return
+        self.observe(stage, (time.monotonic() - t_mono) * 1000.0, **dims)
+
+    # ---------------- Fill takibi ----------------
+
+    def track_fill(self, order_id, stage: str, t_mono: float | None, **dims) -> None:
+        """Broker'a kabul ettirilen emrin dolma gecikmesini ölçmek için kaydeder."""
+        if order_id is None or t_mono is None:
+            return
+        with self._lock:
+            self._pending_fills[str(order_id)] = (stage, t_mono, dims)
+            while len(self._pending_fills) > FILL_TRACK_MAX:
+                self._pending_fills.popitem(last=False)
+
+    def on_fill(self, order_id) -> None:
+        """Broker fill event'inden çağrılır (ilk fill sayılır)."""
+        with self._lock:
+            pending = self._pending_fills.pop(str(order_id), None)
+        if pending is not None:
+            stage, t_mono, dims = pending
+            self.since(stage, t_mono, **dims)
+
+    # ---------------- Rapor ----------------
+
+    def snapshot(self) -> dict:
+        """
+        {stage: {"all": {...}, "by_broker": {"ibkr": {...}}, "by_portfolio": {...}}}
+        """
+        result = {}
+        for (stage, dim, value), hist in sorted(
+            list(self._hists.items()), key=lambda kv: (kv[0][0], kv[0][1] or "", kv[0][2] or "")
+        ):
+            entry = result.setdefault(stage, {"all": None})
+            if dim is None:
+                entry["all"] = hist.summary()
+            else:
+                entry.setdefault(f"by_{dim}", {})[value] = hist.summary()
+        return {
+            "since": self.started_at,
+            "pending_fills": len(self._pending_fills),
+            "stages": result,
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._hists = {}
+            self.started_at = time.time()
+
+
+# Global tek instance
+latency = LatencyRecorder()
@@ -0,0 +1,212 @@
+"""
+metrics.py
+Prometheus text formatında (/metrics) metrik toplama.
+
+Toplama kilitsizdir: her thread kendi "shard"ına (sayaç / histogram
+dict'leri) yazar; shard thread'e ilk kullanımda bir kez kaydedilir.
+Sadece /metrics çağrısı tüm shard'ları birleştirir. Böylece /api/order
+gibi sıcak yollarda metrik kaydı bir dict artırımından ibarettir.
+Biten thread'lerin (Flask her isteğe thread açabilir) shard'ları
+"retired" toplamına katlanır; shard listesi büyümez.
+
+Gauge'lar (journal kuyruk derinliği, broker bağlantısı ...) kayıt
+sırasında değil, /metrics anında callback ile okunur.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, g, request
+
+# Saniye cinsinden histogram sınırları
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+RETIRE_CHECK = 64    # shard sayısı bunu aşınca biten thread'ler katlanır
+
+
+class _Shard:
+    __slots__ = ("counters", "hists")
+
+    def __init__(self):
+        self.counters = {}   # (name, labels) → float
+        self.hists = {}      # (name, labels) → [bucket_counts..., +Inf, sum]
+
+
+def _add_into(total: _Shard, shard: _Shard) -> None:
+    for key, value in list(shard.counters.items()):
+        total.counters[key] = total.counters.get(key, 0.0) + value
+    for key, data in list(shard.hists.items()):
+        current = total.hists.get(key)
+        if current is None:
+            total.hists[key] = list(data)
+        else:
+            for i, v in enumerate(list(data)):
+                current[i] += v
+
+
+def _fmt_value(value: float) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _labels(labels: dict | None) -> tuple:
+    return tuple(sorted((labels or {}).items()))
+
+
+def _fmt_labels(labels: tuple, extra: tuple = ()) -> str:
+    items = labels + extra
+    if not items:
+        return ""
+    parts = []
+    for k, v in items:
+        v = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class Metrics:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._local = threading.local()
+        self._shards = []    # (thread, shard)
+        self._retired = _Shard()
+        self._lock = threading.Lock()
+        self._meta = {}      # name → (type, help)
+        self._gauges = {}    # name → (help, fn) ; fn() → float | {labels_tuple: float}
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = _Shard()
+            self._local.shard = shard
+            with self._lock:
+                if len(self._shards) >= RETIRE_CHECK:
+                    self._retire_dead()
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _retire_dead(self) -> None:
+        """Biten thread'lerin shard'larını retired toplamına katlar (lock altında)."""
+        alive = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                _add_into(self._retired, shard)
+        self._shards = alive
+
+    # ---------------- Kayıt ----------------
+
+    def describe(self, name: str, mtype: str, help_text: str) -> None:
+        self._meta[name] = (mtype, help_text)
+
+    def inc(self, name: str, labels: dict | None = None, value: float = 1.0) -> None:
+        counters = self._shard().counters
+        key = (name, _labels(labels))
+        counters[key] = counters.get(key, 0.0) + value
+
+    def observe(self, name: str, seconds: float, labels: dict | None = None) -> None:
+        hists = self._shard().hists
+        key = (name, _labels(labels))
+        data = hists.get(key)
+        if data is None:
+            data = [0] * (len(self.buckets) + 1) + [0.0]
+            hists[key] = data
+        data[bisect_left(self.buckets, seconds)] += 1
+        data[-1] += seconds
+
+    def gauge(self, name: str, help_text: str, fn) -> None:
+        """
+        fn() → sayı ya da {(("label", "değer"), ...): sayı}
+        /metrics anında çağrılır. Aynı isimle tekrar kayıt öncekinin yerine geçer
+        (ör. Boru API ile admin aynı süreçte çalışırken).
+        """
+        self._gauges[name] = (help_text, fn)
+
+    # ---------------- Flask ----------------
+
+    def instrument(self, app, app_name: str) -> None:
+        """Her isteği sayar ve süresini route bazında histogram'a yazar; /metrics ekler."""
+
+        @app.before_request
+        def _metrics_start():
+            g._metrics_start = time.perf_counter()
+
+        @app.after_request
+        def _metrics_record(response):
+            start = getattr(g, "_metrics_start", None)
+            if start is not None:
+                route = request.url_rule.rule if request.url_rule else "unmatched"
+                labels = {"app": app_name, "method": request.method, "route": route}
+                self.observe("http_request_duration_seconds", time.perf_counter() - start, labels)
+                labels["status"] = str(response.status_code)
+                self.inc("http_requests_total", labels)
+            return response
+
+        @app.route("/metrics")
+        def metrics_endpoint():
+            return Response(self.render(), content_type=CONTENT_TYPE)
+
+    # ---------------- Çıktı ----------------
+
+    def _merge(self):
+        merged = _Shard()
+        with self._lock:
+            self._retire_dead()
+            _add_into(merged, self._retired)
+            shards = [shard for _, shard in self._shards]
+        for shard in shards:
+            _add_into(merged, shard)
+        return merged.counters, merged.hists
+
+    def _header(self, lines: list, name: str, default_type: str) -> None:
+        mtype, help_text = self._meta.get(name, (default_type, name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {mtype}")
+
+    def render(self) -> str:
+        counters, hists = self._merge()
+        lines = []
+
+        for name in sorted({n for n, _ in counters}):
+            self._header(lines, name, "counter")
+            for (n, labels), value in sorted(counters.items()):
+                if n == name:
+                    lines.append(f"{name}{_fmt_labels(labels)} {_fmt_value(value)}")
+
+        for name in sorted({n for n, _ in hists}):
+            self._header(lines, name, "histogram")
+            for (n, labels), data in sorted(hists.items()):
+                if n != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), data[:-1]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_fmt_labels(labels, (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_sum{_fmt_labels(labels)} {data[-1]:.6f}")
+                lines.append(f"{name}_count{_fmt_labels(labels)} {cumulative}")
+
+        for name, (help_text, fn) in list(self._gauges.items()):
+            try:
+                value = fn()
+            except Exception as e:
+                print("metrics gauge error:", name, e)
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            if isinstance(value, dict):
+                for labels, v in value.items():
+                    lines.append(f"{name}{_fmt_labels(tuple(labels))} {_fmt_value(v)}")
+            else:
+                lines.append(f"{name} {_fmt_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+# Global tek instance (her süreç kendi /metrics'ini sunar)
+metrics = Metrics()
+metrics.describe("http_requests_total", "counter", "HTTP istek sayısı (app, method, route, status)")
+metrics.describe("http_request_duration_seconds", "histogram", "HTTP istek süresi (route bazında)")
+metrics.describe("upstream_requests_total", "counter", "Dış servis çağrıları (target, path, outcome)")
+metrics.describe("upstream_request_duration_seconds", "histogram", "Dış servis çağrı süresi")
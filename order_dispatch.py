@@ -0,0 +1,290 @@
+"""
+order_dispatch.py
+Emirlerin broker'a gönderilmesini HTTP isteğinden ayıran katman.
+
+Endpoint emri doğrular, journal'a yazar, buraya bırakır ve 202 + order_id
+ile hemen döner. Emrin durumu OrderTracker'dan (/api/order/<order_id>)
+sorgulanır.
+
+Her IBKR hesabı (lane) için ayrı, sınırlı bir kuyruk + worker thread vardır:
+- farklı hesapların emirleri paralel çalışır,
+- aynı hesabın emirleri geliş sırasıyla çalışır,
+- kuyruk doluysa LaneFull fırlatılır (HTTP katmanı 429 + Retry-After döner).
+
+Durumlar: ACCEPTED → SENDING → DONE | FAILED   (kuyruk doluysa REJECTED,
+senkron çağrı başlamadan süresi dolarsa CANCELLED)
+
+Senkron call() da emri OrderTracker'a "call-..." id'siyle kaydeder: çağıran
+zaman aşımına uğrasa bile emrin geç gelen sonucu oradan görülebilir.
+"""
+import concurrent.futures
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime
+from uuid import uuid4
+
+from latency import latency
+
+LANE_DEPTH = 100         # lane başına bekleyebilecek max emir
+TRACK_MAX = 10000        # hafızada durumu tutulacak son emir sayısı
+CALL_TIMEOUT = 30.0      # senkron çağrılarda (call) sonucu bekleme süresi
+
+
+TRACK_FIELDS = ("symbol", "side", "qty", "quantity", "usd_amount", "portfolio", "account_id")
+
+
+class CallTimeout(TimeoutError):
+    """
+    call() sonucu süresinde gelmedi.
+    started=False → iş hiç başlamadı ve iptal edildi (emir gönderilmedi).
+    started=True  → iş lane'de çalışıyor; sonucu future / tracker'dan izlenir.
+    """
+
+    def __init__(self, order_id: str, started: bool, future: Future):
+        super().__init__(f"dispatch timeout: {order_id} (started={started})")
+        self.order_id = order_id
+        self.started = started
+        self.future = future
+
+
+class LaneFull(Exception):
+    """Hesabın emir kuyruğu dolu."""
+
+    def __init__(self, lane: str, retry_after: int):
+        super().__init__(f"dispatch lane dolu: {lane}")
+        self.lane = lane
+        self.retry_after = retry_after
+
+
+def _now_iso() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+
+class OrderTracker:
+    """Son TRACK_MAX emrin durumunu tutar (eskiler otomatik düşer)."""
+
+    def __init__(self, max_size: int = TRACK_MAX):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._orders = OrderedDict()
+        self._listeners = []
+
+    def add_listener(self, fn) -> None:
+        """Durum değişince çağrılır: fn(state_kopyası) (ör. /api/stream yayını)."""
+        self._listeners.append(fn)
+
+    def _notify(self, state: dict) -> None:
+        for fn in list(self._listeners):
+            try:
+                fn(state)
+            except Exception as e:
+                print("order tracker listener error:", e)
+
+    def add(self, order_id: str, info: dict, **fields) -> dict:
+        """
+        Yeni emir durumu oluşturur; fields (ör. lane) ilk halinde yer alır.
+        Canlı durum değil kopyası döner (değişiklikler update() ile, kilit altında).
+        """
+        state = {
+            "order_id": order_id,
+            "state": "ACCEPTED",
+            "accepted_at": _now_iso(),
+            "started_at": None,
+            "finished_at": None,
+            "order": info,
+            "result": None,
+            "error": None,
+            **fields,
+        }
+        with self._lock:
+            self._orders[order_id] = state
+            while len(self._orders) > self.max_size:
+                self._orders.popitem(last=False)
+            state = dict(state)
+        if self._listeners:
+            self._notify(dict(state))
+        return state
+
+    def update(self, order_id: str, **fields) -> None:
+        with self._lock:
+            state = self._orders.get(order_id)
+            if state is not None:
+                state.update(fields)
+                state = dict(state)
+        if state is not None and self._listeners:
+            self._notify(state)
+
+    def get(self, order_id: str) -> dict | None:
+        with self._lock:
+            state = self._orders.get(order_id)
+            return dict(state) if state is not None else None
+
+
+class _Lane:
+    """Tek hesaba ait sıralı kuyruk + worker thread + metrikler."""
+
+    def __init__(self, name: str, depth: int, runner):
+        self.name = name
+        self.queue = queue.Queue(maxsize=depth)
+        self.lock = threading.Lock()
+        self.metrics = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "wait_ms_avg": 0.0,
+            "wait_ms_max": 0,
+            "exec_ms_avg": 0.0,
+            "exec_ms_max": 0,
+        }
+        self._runner = runner
+        self.thread = threading.Thread(
+            target=self._run, name=f"order-lane-{name}", daemon=True
+        )
+        self.thread.start()
+
+    def _run(self) -> None:
+        while True:
+            job = self.queue.get()
+            self._runner(self, *job)
+
+    def record(self, wait_ms: int, exec_ms: int, ok: bool) -> None:
+        m = self.metrics
+        with self.lock:
+            m["completed" if ok else "failed"] += 1
+            # Üssel hareketli ortalama: son emirlerin gecikmesini yansıtır
+            m["wait_ms_avg"] = round(m["wait_ms_avg"] * 0.9 + wait_ms * 0.1, 2)
+            m["exec_ms_avg"] = round(m["exec_ms_avg"] * 0.9 + exec_ms * 0.1, 2)
+            m["wait_ms_max"] = max(m["wait_ms_max"], wait_ms)
+            m["exec_ms_max"] = max(m["exec_ms_max"], exec_ms)
+
+    def retry_after(self) -> int:
+        """Kuyruğun boşalması için tahmini süre (sn, en az 1)."""
+        per_order = max(self.metrics["exec_ms_avg"], 50.0) / 1000.0
+        return max(1, int(self.queue.qsize() * per_order + 0.999))
+
+
+class OrderDispatcher:
+    def __init__(self, lanes=(), depth: int = LANE_DEPTH, tracker: OrderTracker | None = None):
+        self.depth = depth
+        self.tracker = tracker or OrderTracker()
+        self._lock = threading.Lock()
+        self._lanes = {}
+        for name in lanes:
+            self._lane(name)
+
+    def _lane(self, name) -> _Lane:
+        name = str(name or "default")
+        lane = self._lanes.get(name)
+        if lane is None:
+            with self._lock:
+                lane = self._lanes.get(name)
+                if lane is None:
+                    lane = _Lane(name, self.depth, self._run)
+                    self._lanes[name] = lane
+        return lane
+
+    def _enqueue(self, lane_name, order_id, fn, kwargs, future) -> _Lane:
+        lane = self._lane(lane_name)
+        try:
+            lane.queue.put_nowait((order_id, fn, kwargs, time.monotonic(), future))
+        except queue.Full:
+            with lane.lock:
+                lane.metrics["rejected"] += 1
+            raise LaneFull(lane.name, lane.retry_after())
+        with lane.lock:
+            lane.metrics["submitted"] += 1
+        return lane
+
+    def submit(self, order_id: str, info: dict, fn, lane=None, **kwargs) -> dict:
+        """
+        Emri kabul eder ve fn(**kwargs) çağrısını hesabın lane'ine bırakır.
+        Lane doluysa LaneFull fırlatır (emir kabul edilmemiş sayılır).
+        """
+        state = self.tracker.add(order_id, info, lane=str(lane or "default"))
+        try:
+            self._enqueue(lane, order_id, fn, kwargs, None)
+        except LaneFull:
+            self.tracker.update(order_id, state="REJECTED", finished_at=_now_iso())
+            raise
+        return state
+
+    def call(self, fn, lane=None, timeout: float = CALL_TIMEOUT, **kwargs):
+        """
+        fn(**kwargs)'ı hesabın lane'inde (sırası gelince) çalıştırır ve sonucunu bekler.
+        Lane doluysa LaneFull, süre aşılırsa CallTimeout (TimeoutError) fırlatır.
+        """
+        order_id = f"call-{uuid4().hex}"
+        info = {k: kwargs[k] for k in TRACK_FIELDS if k in kwargs}
+        self.tracker.add(order_id, info, lane=str(lane or "default"))
+        future = Future()
+        try:
+            self._enqueue(lane, order_id, fn, kwargs, future)
+        except LaneFull:
+            self.tracker.update(order_id, state="REJECTED", finished_at=_now_iso())
+            raise
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:   # 3.10'da builtin TimeoutError değil
+            # Henüz başlamadıysa hiç çalışmasın; çağıran zaten hata aldı
+            if future.cancel():
+                self.tracker.update(order_id, state="CANCELLED", finished_at=_now_iso())
+                raise CallTimeout(order_id, False, future) from None
+            # Çalışıyor: emir broker'a gidebilir, geç sonuç tracker'a yazılır
+            self.tracker.update(order_id, caller_timed_out=True)
+            raise CallTimeout(order_id, True, future) from None
+
+    def _run(self, lane: _Lane, order_id, fn, kwargs: dict, accepted: float, future) -> None:
+        started = time.monotonic()
+        wait_ms = int((started - accepted) * 1000)
+        if future is not None and not future.set_running_or_notify_cancel():
+            return
+        if order_id is not None:
+            self.tracker.update(
+                order_id, state="SENDING", started_at=_now_iso(), queue_ms=wait_ms
+            )
+
+        ok = False
+        try:
+            result = fn(**kwargs)
+            ok = not isinstance(result, dict) or result.get("ok", True)
+            if future is not None:
+                future.set_result(result)
+            if order_id is not None:
+                self.tracker.update(
+                    order_id,
+                    state="DONE" if ok else "FAILED",
+                    finished_at=_now_iso(),
+                    result=result,
+                    error=None if ok else (result or {}).get("error"),
+                )
+        except Exception as e:
+            print("order_dispatch error:", lane.name, order_id, e)
+            if future is not None:
+                future.set_exception(e)
+            if order_id is not None:
+                self.tracker.update(
+                    order_id, state="FAILED", finished_at=_now_iso(), error=str(e)
+                )
+        finally:
+            exec_ms = int((time.monotonic() - started) * 1000)
+            lane.record(wait_ms, exec_ms, ok)
+            latency.observe("lane_wait", wait_ms, lane=lane.name)
+            latency.observe("lane_exec", exec_ms, lane=lane.name)
+
+    def get(self, order_id: str) -> dict | None:
+        return self.tracker.get(order_id)
+
+    def metrics(self) -> dict:
+        """Lane bazında kuyruk derinliği ve gecikme metrikleri."""
+        result = {}
+        for name, lane in list(self._lanes.items()):
+            with lane.lock:
+                data = dict(lane.metrics)
+            data["depth"] = lane.queue.qsize()
+            data["max_depth"] = lane.queue.maxsize
+            result[name] = data
+        return result
@@ -0,0 +1,218 @@
+"""
+order_history.py
+manual_orders.log için sayfalı emir geçmişi okuyucu.
+
+Journal append-only olduğu için dosya sondan başa (reverse tail) okunur:
+en yeni kayıtlar önce gelir, `limit` dolunca okuma durur. Tüm dosyayı
+parse etmek / sıralamak gerekmez.
+
+Aktif dosya bitince journal_segments'teki kapalı segmentlere (yeniden
+eskiye) geçilir. Segment header'ı (ts aralığı, sembol bloom filtresi)
+sorguyla uyuşmuyorsa segment hiç açılmadan atlanır.
+
+Cursor: "<segment_seq>:<offset>" — son dönen kaydın segment numarası ve
+segment içindeki (sıkıştırılmamış) byte offset'i. Aktif dosya, rotate
+edilince alacağı numarayla adreslenir; böylece sayfalar arasında rotasyon
+olsa da cursor geçerli kalır. Eski tip düz sayı cursor aktif dosyayı gösterir.
+"""
+import json
+import os
+from datetime import datetime, timedelta
+
+import journal_segments
+from order_journal import JOURNAL_PATH
+
+BLOCK_SIZE = 64 * 1024
+DEFAULT_LIMIT = 200
+MAX_LIMIT = 1000
+
+# Journal'a iki süreç (app.py, admin_app.py) yazar ve ts kuyruğa girmeden
+# alınır: satırlar tam ts sırasında değildir. since'ten bu kadar eskiye
+# inilmeden okuma durdurulmaz.
+SINCE_SLACK = 10.0       # sn
+
+
+def iter_lines_reverse(path: str, end: int | None = None):
+    """
+    Dosyayı sondan başa blok blok okur.
+    (satır_başlangıç_offset'i, satır_bytes) çiftleri yield eder.
+    end verilirse o offset'ten önceki kısım okunur.
+    """
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        pos = size if end is None else max(0, min(end, size))
+
+        buf = b""
+        buf_start = pos
+        while pos > 0:
+            read = min(BLOCK_SIZE, pos)
+            pos -= read
+            f.seek(pos)
+            buf = f.read(read) + buf
+            buf_start = pos
+
+            lines = buf.split(b"\n")
+            line_end = buf_start + len(buf)
+            for line in reversed(lines[1:]):
+                line_start = line_end - len(line)
+                if line.strip():
+                    yield line_start, line
+                line_end = line_start - 1
+            # İlk parça eksik olabilir; bir sonraki blokla birleşsin
+            buf = lines[0]
+
+        if buf.strip():
+            yield buf_start, buf
+
+
+def _raw_reverse(path: str, seg: dict, end):
+    """Henüz mühürlenmemiş segment; tam bu sırada mühürlendiyse .gz'den okur."""
+    try:
+        yield from iter_lines_reverse(seg["path"], end)
+    except FileNotFoundError:
+        sealed = {
+            "path": seg["path"] + ".gz",
+            "header": journal_segments.read_header(path, seg["seq"]),
+        }
+        yield from journal_segments.iter_segment_reverse(sealed, end)
+
+
+def _stop_before(since: str | None) -> str | None:
+    """since − SINCE_SLACK (ISO); parse edilemezse None (erken durma yok)."""
+    if not since:
+        return None
+    try:
+        dt = datetime.fromisoformat(since.rstrip("Z"))
+    except ValueError:
+        return None
+    return (dt - timedelta(seconds=SINCE_SLACK)).isoformat()
+
+
+def _parse_cursor(cursor, active_seq: int):
+    if cursor in (None, ""):
+        return active_seq, None
+    cursor = str(cursor)
+    if ":" in cursor:
+        seq, offset = cursor.split(":", 1)
+        return int(seq), int(offset)
+    return active_seq, int(cursor)
+
+
+def _sources(path: str, cursor):
+    """
+    Okunacak kaynakları yeniden eskiye üretir:
+    (seq, header, satır_iteratörü_fabrikası, başlangıç_end)
+    """
+    segments = journal_segments.list_segments(path)
+    active_seq = segments[0]["seq"] + 1 if segments else 1
+    start_seq, start_end = _parse_cursor(cursor, active_seq)
+
+    if start_seq >= active_seq and os.path.exists(path):
+        yield active_seq, None, lambda end: iter_lines_reverse(path, end), start_end
+
+    for seg in segments:
+        if seg["seq"] > start_seq:
+            continue
+        end = start_end if seg["seq"] == start_seq else None
+
+        def reader(end, seg=seg):
+            if seg["compressed"]:
+                return journal_segments.iter_segment_reverse(seg, end)
+            return _raw_reverse(path, seg, end)
+
+        yield seg["seq"], seg["header"], reader, end
+
+
+def _skip_segment(header: dict | None, until: str | None, symbol: str | None) -> bool:
+    if not header:
+        return False
+    if until and header.get("first_ts") and header["first_ts"] > until:
+        return True
+    if symbol and header.get("symbols_bloom"):
+        bloom = journal_segments.SymbolBloom.from_header(header)
+        if not bloom.might_contain(symbol):
+            return True
+    return False
+
+
+def _match(obj: dict, filters: dict) -> bool:
+    for key, expected in filters.items():
+        value = obj.get(key)
+        if value is None or str(value).upper() != expected:
+            return False
+    return True
+
+
+def read_history(
+    path: str = JOURNAL_PATH,
+    limit: int = DEFAULT_LIMIT,
+    cursor=None,
+    since: str | None = None,
+    until: str | None = None,
+    symbol: str | None = None,
+    portfolio: str | None = None,
+    source: str | None = None,
+    side: str | None = None,
+) -> dict:
+    """
+    En yeniden eskiye emir geçmişi.
+    since / until: ISO ts (dahil) — kayıtların "ts" alanıyla string karşılaştırılır.
+    Dönen: {"history": [...], "next_cursor": str | None}
+    """
+    limit = max(1, min(int(limit or DEFAULT_LIMIT), MAX_LIMIT))
+
+    filters = {}
+    for key, value in (("symbol", symbol), ("portfolio", portfolio),
+                       ("source", source), ("side", side)):
+        if value:
+            filters[key] = str(value).upper()
+
+    # JSON parse etmeden önce ucuz ön eleme için
+    needles = [v.encode("utf-8") for v in filters.values()]
+
+    history = []
+    next_cursor = None
+    stop_before = _stop_before(since)
+
+    for seq, header, reader, end in _sources(path, cursor):
+        # Segmentin tamamı since'ten eski → daha eskilere de bakmaya gerek yok
+        if since and header and header.get("last_ts") and header["last_ts"] < since:
+            break
+        if _skip_segment(header, until, filters.get("symbol")):
+            continue
+
+        done = False
+        for offset, raw in reader(end):
+            if needles:
+                upper = raw.upper()
+                if not all(n in upper for n in needles):
+                    continue
+            try:
+                obj = json.loads(raw)
+            except Exception as e:
+                print("order_history parse error:", e, raw[:200])
+                continue
+
+            ts = obj.get("ts", "")
+            if until and ts > until:
+                continue
+            if since and ts < since:
+                # Journal neredeyse zaman sıralı: sıra dışı satırlar kaçmasın
+                # diye sadece since − SINCE_SLACK'ten eskiye inince dur
+                if stop_before and ts < stop_before:
+                    done = True
+                    break
+                continue
+            if filters and not _match(obj, filters):
+                continue
+
+            history.append(obj)
+            if len(history) >= limit:
+                next_cursor = f"{seq}:{offset}"
+                done = True
+                break
+        if done:
+            break
+
+    return {"history": history, "next_cursor": next_cursor}
@@ -0,0 +1,250 @@
+"""
+order_journal.py
+manual_orders.log için ortak journal yazıcısı (group commit).
+
+- Endpoint'ler kaydı kuyruğa bırakır ve hemen döner (dosya aç/yaz/kapat yok).
+- Arka plandaki flusher thread kuyrukta biriken kayıtları tek write() ile
+  yazar; fsync politikası:
+      "none"   : sadece flush (OS cache'e kadar)
+      "batch"  : her batch sonunda bir fsync  (varsayılan)
+      "record" : her kayıttan sonra fsync
+- Kuyruk sınırlıdır: dolarsa append() en fazla `timeout` kadar bekler,
+  sonra JournalFull fırlatır (backpressure).
+- durable=True verilirse append() kayıt diske yazılana kadar bekler.
+- Aktif dosya boyut / yaş sınırını aşınca journal_segments ile rotate
+  edilip gzip'li kapalı segmente dönüştürülür.
+
+app.py ve admin_app.py aynı dosyaya ayrı süreçlerden yazdığı için her
+batch aktif dosya üzerinde flock altında yazılır; başka süreç rotate
+ettiyse (inode değiştiyse) dosya yeniden açılır.
+"""
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows (PC tarafı) — tek süreç varsayımı
+    fcntl = None
+
+import journal_segments
+
+JOURNAL_PATH = os.path.join(os.path.dirname(__file__), "manual_orders.log")
+
+FSYNC_POLICY = "batch"   # none / batch / record
+MAX_QUEUE = 10000        # kuyrukta bekleyebilecek max kayıt
+MAX_BATCH = 512          # tek group commit'e girecek max kayıt
+PUT_TIMEOUT = 1.0        # kuyruk doluysa append()'in bekleyeceği süre (sn)
+
+
+class JournalFull(Exception):
+    """Journal kuyruğu dolu; kayıt kabul edilmedi."""
+
+
+class _Ack:
+    __slots__ = ("done", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+
+
+class OrderJournal:
+    def __init__(
+        self,
+        path: str = JOURNAL_PATH,
+        fsync_policy: str = FSYNC_POLICY,
+        max_queue: int = MAX_QUEUE,
+        max_batch: int = MAX_BATCH,
+        segment_max_bytes: int = journal_segments.SEGMENT_MAX_BYTES,
+        segment_max_age: float = journal_segments.SEGMENT_MAX_AGE,
+    ):
+        if fsync_policy not in ("none", "batch", "record"):
+            raise ValueError(f"invalid fsync_policy: {fsync_policy}")
+
+        self.path = path
+        self.fsync_policy = fsync_policy
+        self.max_batch = max_batch
+        self._queue = queue.Queue(maxsize=max_queue)
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_age = segment_max_age
+        self._file = None
+        self._segment_started = None
+        self._stats = {"records": 0, "batches": 0, "fsyncs": 0, "errors": 0, "rotations": 0}
+
+        # Önceki çalışmadan mühürlenmemiş segment kaldıysa tamamla
+        journal_segments.seal_async(self.path)
+
+        self._thread = threading.Thread(
+            target=self._run, name="order-journal", daemon=True
+        )
+        self._thread.start()
+
+    # ---------------- Public ----------------
+
+    def append(self, record: dict, durable: bool = False, timeout: float = PUT_TIMEOUT) -> bool:
+        """
+        Kaydı journal'a ekler.
+        durable=False: kuyruğa girince True döner.
+        durable=True : diske yazılınca True, timeout'ta False döner;
+                       yazma hatası olursa hatayı fırlatır.
+        """
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        ack = _Ack() if durable else None
+        try:
+            self._queue.put((line, ack), timeout=timeout)
+        except queue.Full:
+            raise JournalFull(f"journal kuyruğu dolu ({self._queue.maxsize})")
+
+        if ack is None:
+            return True
+        if not ack.done.wait(timeout):
+            return False
+        if ack.error is not None:
+            raise ack.error
+        return True
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Kuyruktaki her şey diske yazılana kadar bekler."""
+        ack = _Ack()
+        try:
+            self._queue.put((None, ack), timeout=timeout)
+        except queue.Full:
+            return False
+        return ack.done.wait(timeout)
+
+    def depth(self) -> int:
+        """Kuyrukta bekleyen kayıt sayısı."""
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        data = dict(self._stats)
+        data.update({
+            "queue_depth": self.depth(),
+            "queue_max": self._queue.maxsize,
+            "fsync_policy": self.fsync_policy,
+        })
+        return data
+
+    # ---------------- Flusher thread ----------------
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            # Önceki commit sürerken biriken kayıtları tek seferde al
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._commit(batch)
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+            self._segment_started = self._first_record_time()
+        return self._file
+
+    def _close(self) -> None:
+        try:
+            if self._file is not None:
+                self._file.close()
+        except Exception:
+            pass
+        self._file = None
+
+    def _first_record_time(self):
+        """Aktif segmentin ilk kaydının zamanı (yaş bazlı rotasyon için)."""
+        try:
+            with open(self.path, "rb") as f:
+                first = f.readline()
+            ts = json.loads(first).get("ts", "")
+            return datetime.fromisoformat(ts.rstrip("Z")).timestamp() if ts else None
+        except Exception:
+            return None
+
+    def _lock(self):
+        """Aktif dosyayı flock ile kilitleyip döner (gerekirse yeniden açar)."""
+        while True:
+            f = self._open()
+            if fcntl is None:
+                return f
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                same = os.stat(self.path).st_ino == os.fstat(f.fileno()).st_ino
+            except FileNotFoundError:
+                same = False
+            if same:
+                return f
+            # Başka süreç rotate etti: yeni aktif dosyaya geç
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            self._close()
+
+    def _unlock(self, f) -> None:
+        if fcntl is not None and not f.closed:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _should_rotate(self, f) -> bool:
+        if os.fstat(f.fileno()).st_size >= self.segment_max_bytes:
+            return True
+        if self._segment_started is None:
+            self._segment_started = time.time()
+            return False
+        return time.time() - self._segment_started >= self.segment_max_age
+
+    def _rotate(self, f) -> None:
+        """Kilit altındayken çağrılır: aktif dosyayı kapalı segmente taşır."""
+        journal_segments.rotate(self.path)
+        self._unlock(f)
+        self._close()
+        self._segment_started = None
+        self._stats["rotations"] += 1
+        journal_segments.seal_async(self.path)
+
+    def _commit(self, batch) -> None:
+        lines = [line for line, _ in batch if line is not None]
+        error = None
+        try:
+            if lines:
+                f = self._lock()
+                try:
+                    if self.fsync_policy == "record":
+                        for line in lines:
+                            f.write(line)
+                            f.flush()
+                            os.fsync(f.fileno())
+                            self._stats["fsyncs"] += 1
+                    else:
+                        f.write("".join(lines))
+                        f.flush()
+                        if self.fsync_policy == "batch":
+                            os.fsync(f.fileno())
+                            self._stats["fsyncs"] += 1
+                    self._stats["records"] += len(lines)
+                    self._stats["batches"] += 1
+
+                    if self._should_rotate(f):
+                        self._rotate(f)
+                finally:
+                    if self._file is not None:
+                        self._unlock(f)
+        except Exception as e:
+            print("order_journal write error:", e)
+            self._stats["errors"] += 1
+            error = e
+            # Dosya tutacağı bozulmuş olabilir, sonraki batch yeniden açsın
+            self._close()
+
+        for _, ack in batch:
+            if ack is not None:
+                ack.error = error
+                ack.done.set()
+
+
+# Global tek instance (app.py ve admin_app.py ortak kullanır)
+journal = OrderJournal()
+atexit.register(journal.flush)
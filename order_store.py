@@ -0,0 +1,351 @@
+"""
+order_store.py
+Emirlerin SQLite kopyası (orders.db, WAL modu).
+
+manual_orders.log (JSONL journal) olduğu gibi kalır; ayrıca her emir
+`orders` tablosuna da yazılır. Geçmiş, analiz ve dedup sorguları JSON
+satırlarını tekrar parse etmek yerine indeksli tabloyu kullanır.
+
+- Yazma: tek bir "order-store" thread'i kuyruktaki kayıtları toplu
+  (executemany + tek transaction) ekler; endpoint'ler beklemez.
+- Okuma: her thread kendi bağlantısını kullanır (WAL → okuyucular
+  yazıcıyı beklemez).
+- Tablo boşsa ilk açılışta journal'daki eski kayıtlar içeri alınır.
+"""
+import json
+import os
+import queue
+import sqlite3
+import threading
+from datetime import datetime
+
+import journal_segments
+from order_journal import JOURNAL_PATH
+
+ORDERS_DB = os.path.join(os.path.dirname(__file__), "orders.db")
+
+MAX_QUEUE = 10000
+MAX_BATCH = 500
+BUSY_TIMEOUT = 5.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts TEXT NOT NULL,
+    symbol TEXT,
+    side TEXT,
+    qty REAL,
+    usd_amount REAL,
+    portfolio TEXT,
+    account_id TEXT,
+    source TEXT,
+    signal_id TEXT,
+    order_id TEXT,
+    raw TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_orders_ts ON orders(ts);
+CREATE INDEX IF NOT EXISTS idx_orders_symbol_ts ON orders(symbol, ts);
+CREATE INDEX IF NOT EXISTS idx_orders_portfolio_ts ON orders(portfolio, ts);
+CREATE INDEX IF NOT EXISTS idx_orders_signal_id ON orders(signal_id);
+"""
+
+INSERT_SQL = """
+INSERT INTO orders
+    (ts, symbol, side, qty, usd_amount, portfolio, account_id, source, signal_id, order_id, raw)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def _to_float(val):
+    try:
+        return float(val) if val is not None and val != "" else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _upper(val):
+    return str(val).upper() if val else None
+
+
+# query()'nin büyük/küçük harfe duyarsız filtrelediği kolonlar
+FILTER_COLUMNS = ("symbol", "side", "portfolio", "source")
+
+
+def query_key(query: dict) -> tuple:
+    """
+    query() argümanlarının normalize hali (ETag anahtarı için): boş
+    filtreler atılır, FILTER_COLUMNS büyük harfe çevrilir. Aynı sonucu
+    veren sorgular aynı anahtarı, farklı filtre / cursor farklı anahtarı alır.
+    """
+    key = []
+    for name, value in sorted(query.items()):
+        if value in (None, ""):
+            continue
+        if name in FILTER_COLUMNS:
+            value = str(value).upper()
+        elif name == "limit":
+            value = int(value)
+        else:
+            value = str(value)
+        key.append((name, value))
+    return tuple(key)
+
+
+def _parse_cursor(cursor: str) -> tuple[str, int]:
+    """'<ts>|<id>' cursor'ını ayırır; bozuksa ValueError."""
+    c_ts, sep, c_id = str(cursor).rpartition("|")
+    if not sep or not c_ts or not c_id.isdigit():
+        raise ValueError(f"invalid cursor: {cursor!r}")
+    return c_ts, int(c_id)
+
+
+def _row(record: dict) -> tuple:
+    """
+    Journal kaydını tablo satırına çevirir (farklı endpoint alan adlarını toparlar).
+    Filtrelenen metin kolonları (symbol, side, portfolio, source) büyük harfle
+    saklanır; query() parametreleri de aynı şekilde normalize eder.
+    """
+    qty = record.get("qty")
+    if qty is None:
+        qty = record.get("quantity")
+    return (
+        record.get("ts") or datetime.utcnow().isoformat() + "Z",
+        _upper(record.get("symbol")),
+        _upper(record.get("side")),
+        _to_float(qty),
+        _to_float(record.get("usd_amount")),
+        _upper(record.get("portfolio")),
+        record.get("account_id"),
+        _upper(record.get("source")),
+        record.get("signal_id"),
+        str(record["order_id"]) if record.get("order_id") is not None else None,
+        json.dumps(record, ensure_ascii=False, default=str),
+    )
+
+
+class OrderStore:
+    def __init__(self, path: str = ORDERS_DB, backfill_from: str | None = None):
+        self.path = path
+        self._queue = queue.Queue(maxsize=MAX_QUEUE)
+        self._local = threading.local()
+        self._ready = threading.Event()
+        self._stats = {"inserted": 0, "batches": 0, "errors": 0, "backfilled": 0}
+        # Bu andan sonraki kayıtlar zaten kuyruktan gelecek; backfill almasın
+        self._started_ts = datetime.utcnow().isoformat() + "Z"
+
+        self._thread = threading.Thread(
+            target=self._run, args=(backfill_from,), name="order-store", daemon=True
+        )
+        self._thread.start()
+
+    # ---------------- Bağlantılar ----------------
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        self._ready.wait(BUSY_TIMEOUT)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    # ---------------- Yazma ----------------
+
+    def add(self, record: dict) -> bool:
+        """Kaydı yazma kuyruğuna bırakır. Kuyruk doluysa False döner."""
+        try:
+            self._queue.put_nowait((_row(record), None))
+            return True
+        except queue.Full:
+            self._stats["errors"] += 1
+            print("order_store queue full, record dropped:", record.get("symbol"))
+            return False
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Kuyruktaki kayıtlar tabloya yazılana kadar bekler."""
+        done = threading.Event()
+        try:
+            self._queue.put((None, done), timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def _run(self, backfill_from: str | None) -> None:
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        self._migrate(conn)
+        self._ready.set()
+
+        if backfill_from:
+            self._backfill(conn, backfill_from)
+
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < MAX_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            rows = [row for row, _ in batch if row is not None]
+            if rows:
+                try:
+                    with conn:
+                        conn.executemany(INSERT_SQL, rows)
+                    self._stats["inserted"] += len(rows)
+                    self._stats["batches"] += 1
+                except Exception as e:
+                    print("order_store write error:", e)
+                    self._stats["errors"] += 1
+
+            for _, done in batch:
+                if done is not None:
+                    done.set()
+
+    def _migrate(self, conn: sqlite3.Connection) -> None:
+        """Eski sürümün büyük/küçük harf karışık yazdığı portfolio / source kolonları."""
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= 1:
+                return
+            with conn:
+                conn.execute(
+                    "UPDATE orders SET portfolio = UPPER(portfolio), source = UPPER(source) "
+                    "WHERE portfolio <> UPPER(portfolio) OR source <> UPPER(source)"
+                )
+                conn.execute("PRAGMA user_version = 1")
+        except Exception as e:
+            print("order_store migrate error:", e)
+
+    def _backfill(self, conn: sqlite3.Connection, journal_path: str) -> None:
+        """
+        Tablo boşsa journal'daki (segmentler dahil) eski emirleri içeri alır.
+        Tek IMMEDIATE transaction: aynı anda açılan diğer süreç ikinci kez almasın.
+        """
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT 1 FROM orders LIMIT 1").fetchone():
+                conn.rollback()
+                return
+
+            rows = []
+            for record in journal_segments.iter_records(journal_path):
+                if record.get("ts", "") >= self._started_ts:
+                    continue
+                # Netleştirme kararları emir değil, sadece journal'da kalır
+                if record.get("event_type") == "NETTING":
+                    continue
+                rows.append(_row(record))
+                if len(rows) >= MAX_BATCH:
+                    conn.executemany(INSERT_SQL, rows)
+                    self._stats["backfilled"] += len(rows)
+                    rows = []
+            if rows:
+                conn.executemany(INSERT_SQL, rows)
+                self._stats["backfilled"] += len(rows)
+            conn.commit()
+        except Exception as e:
+            print("order_store backfill error:", e)
+            conn.rollback()
+
+    # ---------------- Okuma ----------------
+
+    def query(
+        self,
+        limit: int = 200,
+        cursor: str | None = None,
+        since: str | None = None,
+        until: str | None = None,
+        symbol: str | None = None,
+        portfolio: str | None = None,
+        source: str | None = None,
+        side: str | None = None,
+    ) -> dict:
+        """
+        En yeniden eskiye emir geçmişi.
+        Cursor: "<ts>|<id>" — son dönen kaydın (ts, id) çifti.
+        Filtreler büyük/küçük harfe duyarsızdır. Bozuk cursor → ValueError.
+        """
+        where = []
+        params = []
+        if symbol:
+            where.append("symbol = ?")
+            params.append(symbol.upper())
+        if portfolio:
+            where.append("portfolio = ?")
+            params.append(portfolio.upper())
+        if source:
+            where.append("source = ?")
+            params.append(source.upper())
+        if side:
+            where.append("side = ?")
+            params.append(side.upper())
+        if since:
+            where.append("ts >= ?")
+            params.append(since)
+        if until:
+            where.append("ts <= ?")
+            params.append(until)
+        if cursor:
+            c_ts, c_id = _parse_cursor(cursor)
+            where.append("(ts < ? OR (ts = ? AND id < ?))")
+            params.extend([c_ts, c_ts, c_id])
+
+        sql = "SELECT id, ts, raw FROM orders"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY ts DESC, id DESC LIMIT ?"
+        params.append(int(limit))
+
+        rows = self._reader().execute(sql, params).fetchall()
+        history = [json.loads(r["raw"]) for r in rows]
+        next_cursor = None
+        if len(rows) == int(limit):
+            last = rows[-1]
+            next_cursor = f"{last['ts']}|{last['id']}"
+        return {"history": history, "next_cursor": next_cursor}
+
+    def version(self) -> int:
+        """
+        Tablonun veri sürümü (ETag için): en büyük id.
+        Tablo sadece eklemeyle büyür (AUTOINCREMENT) → her yeni kayıt sürümü artırır.
+        Başka süreçlerin (Boru API) yazdıkları da görünür; PRIMARY KEY'den O(log n).
+        """
+        row = self._reader().execute("SELECT MAX(id) FROM orders").fetchone()
+        return row[0] or 0
+
+    def find_by_signal_id(self, signal_id: str) -> dict | None:
+        """signal_id ile kaydedilmiş son emri döner (dedup için)."""
+        row = self._reader().execute(
+            "SELECT raw FROM orders WHERE signal_id = ? ORDER BY id DESC LIMIT 1",
+            (signal_id,),
+        ).fetchone()
+        return json.loads(row["raw"]) if row else None
+
+    def summary(self, since: str | None = None) -> dict:
+        """Analiz sayfası için portföy / taraf / kaynak bazında emir sayıları."""
+        cond = " WHERE ts >= ?" if since else ""
+        params = [since] if since else []
+        conn = self._reader()
+        result = {"total": conn.execute("SELECT COUNT(*) FROM orders" + cond, params).fetchone()[0]}
+        for col in ("portfolio", "side", "source", "symbol"):
+            rows = conn.execute(
+                f"SELECT {col} AS k, COUNT(*) AS n FROM orders{cond} GROUP BY {col} ORDER BY n DESC LIMIT 50",
+                params,
+            ).fetchall()
+            result[f"by_{col}"] = {(r["k"] or "-"): r["n"] for r in rows}
+        return result
+
+    def stats(self) -> dict:
+        data = dict(self._stats)
+        data["queue_depth"] = self._queue.qsize()
+        return data
+
+
+# Global tek instance
+orders = OrderStore(backfill_from=JOURNAL_PATH)
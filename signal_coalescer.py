@@ -0,0 +1,157 @@
+"""
+signal_coalescer.py
+Sinyal fırtınaları için (symbol, portfolio) bazlı netleştirme penceresi.
+
+Pencere açıkken (COALESCE_WINDOW_MS) aynı sembol + portföye gelen
+BUY/SELL sinyalleri biriktirilir; pencere kapanınca tek bir emre
+netleştirilir:
+    BUY 1000 + SELL 400   → BUY 600
+    BUY 500  + SELL 500   → emir yok (CANCELLED_OUT)
+Her sinyal nete katılır: BUY 100 → SELL 100 → BUY 100 = BUY 100,
+iki ayrı BUY 100 = BUY 200. Sadece aynı signal_id ile tekrar gelen sinyal
+(webhook'un aynı isteği yeniden göndermesi) retry sayılıp tek sayılır.
+signal_id'siz sinyaller hiç birleştirilmez: aynı taraf + miktardaki iki
+manuel emir iki ayrı emirdir.
+
+Miktar birimi (usd / qty) anahtarın parçasıdır; farklı birimler
+birbirine karıştırılmaz. Her netleştirme kararı journal'a yazılır.
+
+COALESCE_WINDOW_MS = 0 → kapalı (her sinyal direkt gönderilir).
+"""
+import threading
+import time
+from datetime import datetime
+from uuid import uuid4
+
+COALESCE_WINDOW_MS = 0           # 0 = kapalı; önerilen 250–2000
+COLLAPSE_DUPLICATES = True       # retry'ları (bkz. yukarı) tek say
+
+
+def _retries(items: list) -> list:
+    """Her sinyal için retry mi (nete katılmayacak) bayrağı."""
+    flags = []
+    seen_ids = set()
+    for item in items:
+        sid = item["signal_id"]
+        flags.append(sid is not None and sid in seen_ids)
+        if sid is not None:
+            seen_ids.add(sid)
+    return flags
+
+
+class SignalCoalescer:
+    def __init__(
+        self,
+        window_ms: int = COALESCE_WINDOW_MS,
+        on_flush=None,
+        journal=None,
+        collapse_duplicates: bool = COLLAPSE_DUPLICATES,
+    ):
+        """
+        on_flush(bucket_id, netted, last_signal) pencere kapanınca çağrılır.
+        netted: {"symbol", "portfolio", "side", "amount", "unit"} ya da
+                sinyaller birbirini sıfırladıysa None.
+        """
+        self.window_ms = window_ms
+        self.on_flush = on_flush
+        self.journal = journal
+        self.collapse_duplicates = collapse_duplicates
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._stats = {"signals": 0, "buckets": 0, "orders": 0, "cancelled_out": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_ms > 0
+
+    def offer(self, symbol: str, portfolio: str | None, side: str, amount, unit: str, signal: dict) -> str:
+        """
+        Sinyali pencereye ekler; ait olduğu bucket_id'yi döner.
+        signal["ref"] (order_id / signal_id) netleştirme kaydına yazılır;
+        Retry tespiti sadece signal["signal_id"] ile yapılır (yoksa retry sayılmaz).
+        """
+        key = (str(symbol).upper(), portfolio or "-", unit)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = {"id": uuid4().hex, "opened": time.monotonic(), "signals": []}
+                self._buckets[key] = bucket
+                self._stats["buckets"] += 1
+                timer = threading.Timer(self.window_ms / 1000.0, self._flush, args=(key,))
+                timer.daemon = True
+                timer.start()
+            bucket["signals"].append({
+                "side": side.upper(),
+                "amount": float(amount),
+                "signal_id": signal.get("signal_id"),
+                "signal": signal,
+            })
+            self._stats["signals"] += 1
+            return bucket["id"]
+
+    def _flush(self, key) -> None:
+        with self._lock:
+            bucket = self._buckets.pop(key, None)
+        if not bucket:
+            return
+
+        symbol, portfolio, unit = key
+        items = bucket["signals"]
+        retries = _retries(items) if self.collapse_duplicates else [False] * len(items)
+        used = [item for item, retry in zip(items, retries) if not retry]
+
+        net = sum(i["amount"] if i["side"] == "BUY" else -i["amount"] for i in used)
+        if abs(net) < 1e-9:
+            netted = None
+            decision = "CANCELLED_OUT"
+            self._stats["cancelled_out"] += 1
+        else:
+            netted = {
+                "symbol": symbol,
+                "portfolio": None if portfolio == "-" else portfolio,
+                "side": "BUY" if net > 0 else "SELL",
+                "amount": round(abs(net), 8),
+                "unit": unit,
+            }
+            decision = "SEND"
+            self._stats["orders"] += 1
+
+        self._record(bucket, key, items, retries, netted, decision)
+
+        if self.on_flush is not None:
+            try:
+                self.on_flush(bucket["id"], netted, items[-1]["signal"])
+            except Exception as e:
+                print("signal_coalescer flush error:", bucket["id"], e)
+
+    def _record(self, bucket, key, items, retries: list, netted, decision: str) -> None:
+        if self.journal is None:
+            return
+        symbol, portfolio, unit = key
+        try:
+            self.journal.append({
+                "ts": datetime.utcnow().isoformat() + "Z",
+                "event_type": "NETTING",
+                "bucket_id": bucket["id"],
+                "symbol": symbol,
+                "portfolio": None if portfolio == "-" else portfolio,
+                "unit": unit,
+                "window_ms": self.window_ms,
+                "inputs": [
+                    {"side": i["side"], "amount": i["amount"], "ref": i["signal"].get("ref"),
+                     "retry": retry}
+                    for i, retry in zip(items, retries)
+                ],
+                "duplicates_collapsed": sum(retries),
+                "decision": decision,
+                "net_side": netted["side"] if netted else None,
+                "net_amount": netted["amount"] if netted else 0.0,
+            })
+        except Exception as e:
+            print("signal_coalescer journal error:", e)
+
+    def stats(self) -> dict:
+        data = dict(self._stats)
+        data["open_buckets"] = len(self._buckets)
+        data["window_ms"] = self.window_ms
+        return data
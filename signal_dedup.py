@@ -0,0 +1,154 @@
+"""
+signal_dedup.py
+TradingView webhook tekrarları için idempotency katmanı.
+
+Anahtar: payload'daki signal_id; yoksa payload'ın (sıralı JSON) sha256 özeti.
+- signal_id'li anahtarlar DEDUP_TTL (24 saat) boyunca tekrar sayılır.
+- sha256 anahtarları sadece RETRY_TTL kadar: signal_id'siz aynı alarm
+  (ör. her saat aynı "BUY AAPL") meşru olarak tekrar gelebilir; sadece
+  webhook'un kısa süre içindeki yeniden gönderimleri elenir.
+- Hafızada sınırlı, TTL'li index'ler (TTL sınıfı başına bir OrderedDict).
+- Hafızada yoksa ve signal_id varsa orders.db'ye bakılır (restart sonrası).
+- Aynı anahtar işlenirken gelen tekrar, ilk isteğin sonucunu bekler;
+  broker'a ikinci kez gidilmez.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+DEDUP_TTL = 24 * 3600      # signal_id'li sinyalin tekrar sayılacağı süre (sn)
+RETRY_TTL = 30.0           # payload hash'li (signal_id'siz) sinyal için (sn)
+DEDUP_MAX = 100_000        # hafızada tutulacak max anahtar
+WAIT_TIMEOUT = 30.0        # işlenmekte olan ilk isteği bekleme süresi
+
+
+def dedup_key(payload: dict) -> str:
+    signal_id = payload.get("signal_id")
+    if signal_id:
+        return f"sid:{signal_id}"
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return "sha256:" + hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("expires", "event", "done")
+
+    def __init__(self, expires: float):
+        self.expires = expires
+        self.event = None
+        self.done = threading.Event()
+
+
+class SignalDedup:
+    def __init__(self, ttl: float = DEDUP_TTL, max_size: int = DEDUP_MAX, store=None,
+                 retry_ttl: float = RETRY_TTL):
+        self.ttl = ttl
+        self.retry_ttl = retry_ttl
+        self.max_size = max_size
+        self.store = store
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()        # sid: anahtarları
+        self._retry_entries = OrderedDict()  # sha256: anahtarları
+        self._stats = {"new": 0, "duplicates": 0, "store_hits": 0}
+
+    def _table(self, key: str) -> tuple[OrderedDict, float]:
+        if key.startswith("sid:"):
+            return self._entries, self.ttl
+        return self._retry_entries, self.retry_ttl
+
+    def _evict(self, table: OrderedDict, now: float) -> None:
+        # Bitmiş anahtarlar complete()'te sona taşınır: tablo başından itibaren
+        # bitmiş olanlar bitiş (= expires, sabit TTL) sırasındadır.
+        # Sonucu bekleyen (pending) anahtar süresi dolsa da, tablo max_size'ı
+        # aşsa da düşmez; sona alınıp arkasındakilere bakılır.
+        for _ in range(len(table)):
+            key, entry = next(iter(table.items()))
+            if not entry.done.is_set():
+                table.move_to_end(key)
+                continue
+            if entry.expires > now and len(table) <= self.max_size:
+                break
+            table.popitem(last=False)
+
+    def claim(self, key: str):
+        """
+        (True, None)   → yeni sinyal, çağıran işlemeli ve complete/release çağırmalı
+        (False, event) → tekrar; event ilk işlemin master_event'i
+        (False, None)  → tekrar; ilk işlem WAIT_TIMEOUT içinde bitmedi
+        """
+        table, ttl = self._table(key)
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                entry = table.get(key)
+                if entry is not None and entry.expires <= now and entry.done.is_set():
+                    table.pop(key, None)
+                    entry = None
+                if entry is None:
+                    entry = _Entry(now + ttl)
+                    table[key] = entry
+                    fresh = True
+                else:
+                    fresh = False
+                self._evict(table, now)
+
+            if fresh:
+                # Hafızada yok: restart öncesinde işlenmiş olabilir
+                previous = self._lookup_store(key)
+                if previous is None:
+                    self._stats["new"] += 1
+                    return True, None
+                self._stats["store_hits"] += 1
+                self.complete(key, previous)
+                self._stats["duplicates"] += 1
+                return False, previous
+
+            if not entry.done.wait(WAIT_TIMEOUT):
+                # İlk istek hâlâ sürüyor: ikinci kez işleme, "işleniyor" de
+                self._stats["duplicates"] += 1
+                return False, None
+            if entry.event is not None:
+                self._stats["duplicates"] += 1
+                return False, entry.event
+            # İlk işlem başarısız olup bırakıldı (release) → tekrar dene
+
+    def _lookup_store(self, key: str):
+        if self.store is None or not key.startswith("sid:"):
+            return None
+        try:
+            return self.store.find_by_signal_id(key[4:])
+        except Exception as e:
+            print("signal_dedup store lookup error:", e)
+            return None
+
+    def complete(self, key: str, event: dict) -> None:
+        table, ttl = self._table(key)
+        with self._lock:
+            entry = table.get(key)
+            if entry is None:
+                return
+            # TTL işlemin bittiği andan itibaren sayılır; sıra da bitişe göre
+            entry.expires = max(entry.expires, time.monotonic() + ttl)
+            table.move_to_end(key)
+        entry.event = event
+        entry.done.set()
+
+    def release(self, key: str) -> None:
+        """
+        İşlem başarısız ve emir broker'a GİTMEDİ: anahtarı bırak, bekleyenler
+        kendisi dener. Sonucu belirsiz işlemlerde (zaman aşımı, hâlâ çalışıyor)
+        çağrılmamalı; anahtar complete() gelene kadar "pending" kalır.
+        """
+        table, _ = self._table(key)
+        with self._lock:
+            entry = table.pop(key, None)
+        if entry is not None:
+            entry.done.set()
+
+    def stats(self) -> dict:
+        data = dict(self._stats)
+        data["size"] = len(self._entries)
+        data["retry_size"] = len(self._retry_entries)
+        return data
@@ -1,49 +1,51 @@
+import os
+import sys
+
 from flask import Flask
-import requests
+
+# Kök dizindeki boru_client modülü için
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import boru_client
+from boru_client import BoruClient
 
 app = Flask(__name__)
 
 # API aynı makinede çalışıyor
 API_BASE = "http://127.0.0.1:5055"
 
+# boru_client.COHOSTED=True → Boru API bu sürece yüklenir, HTTP hop'u olmaz
+api = BoruClient(API_BASE)
+boru_client.mount(app, api)
+
 
 @app.route("/")
 def index():
-    # Varsayılan boş değerler
-    health = {}
-    ibkr_status = {}
-    account = {}
-    positions = []
     errors = []
 
-    # API HEALTH
-    try:
-        r = requests.get(f"{API_BASE}/api/health", timeout=2)
-        health = r.json()
-    except Exception as e:
-        errors.append(f"API health hata: {e}")
-
-    # IBKR STATUS
-    try:
-        r = requests.get(f"{API_BASE}/api/ibkr/status", timeout=2)
-        ibkr_status = r.json()
-    except Exception as e:
-        errors.append(f"IBKR status hata: {e}")
-
-    # IBKR ACCOUNT
-    try:
-        r = requests.get(f"{API_BASE}/api/ibkr/account", timeout=2)
-        account = r.json()
-    except Exception as e:
-        errors.append(f"IBKR account hata: {e}")
-
-    # IBKR POSITIONS
+    # Tek istek: Boru API dört bölümü (health, ibkr status/account/positions)
+    # paralel toplar → sayfa süresi en yavaş bölüm kadar, toplamı değil
     try:
-        r = requests.get(f"{API_BASE}/api/ibkr/positions", timeout=2)
-        data = r.json()
-        positions = data.get("positions", [])
+        r = api.get("/api/dashboard", timeout=3)
+        sections = r.json().get("sections", {})
     except Exception as e:
-        errors.append(f"IBKR positions hata: {e}")
+        sections = {}
+        errors.append(f"API dashboard hata: {e}")
+
+    labels = {
+        "health": "API health",
+        "ibkr_status": "IBKR status",
+        "account": "IBKR account",
+        "positions": "IBKR positions",
+    }
+    for name, label in labels.items():
+        section = sections.get(name)
+        if section and section.get("error"):
+            errors.append(f"{label} hata: {section['error']} ({section.get('ms')} ms)")
+
+    health = (sections.get("health") or {}).get("data") or {}
+    ibkr_status = (sections.get("ibkr_status") or {}).get("data") or {}
+    account = (sections.get("account") or {}).get("data") or {}
+    positions = ((sections.get("positions") or {}).get("data") or {}).get("positions", [])
 
     # FLAG: Bağlı mı?
     connected = bool(ibkr_status.get("ibkr_connected"))